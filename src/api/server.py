@@ -0,0 +1,284 @@
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+from http import HTTPStatus
+from src.database.index_registry import SessionKnowledgeBase, get_index_registry
+from src.llm.prompts import prompt_cache_stats
+from src.llm.qa_processor import QAProcessor
+from src.utils.call_governor import CircuitOpenError, get_all_governor_stats
+from src.utils.config import get_snapshot_dir, load_env_vars
+from src.utils.logger import get_logger, setup_logging, shutdown_logging
+
+
+# 设置日志
+logger = get_logger("api.server")
+
+# 请求头与请求体的大小及读取超时限制
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+READ_TIMEOUT = 30.0
+
+
+class QAServer:
+    """
+    Minimal HTTP/1.1 service over the async QA pipeline, running on a single event loop.
+
+    POST /ask    {"question": str, "doc_ids": [str], "stream": bool}
+                 -> {"answer": str}, or server-sent events when stream is true:
+                    data: {"delta": str} ... then event: done
+    GET /health  -> document count and model service stats
+
+    Failures before any answer text is produced are plain JSON errors: 503 with
+    Retry-After while the model service's circuit is open, 500 otherwise. A
+    stream that fails midway ends with an "event: error" instead of done.
+
+    Every response closes its connection, so no keep-alive handling is needed.
+    """
+
+    def __init__(self, qa_processor: QAProcessor):
+        self.qa_processor = qa_processor
+
+    async def start(self, host: str, port: int):
+        """
+        Start listening and return the asyncio server
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        logger.info("问答HTTP服务已启动: %s", ", ".join(str(sock.getsockname()) for sock in server.sockets))
+        return server
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, body = await asyncio.wait_for(self._read_request(reader), READ_TIMEOUT)
+            except _HTTPError as e:
+                await self._send_json(writer, e.status, {"error": e.message})
+                return
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                await self._send_json(writer, HTTPStatus.BAD_REQUEST, {"error": "请求格式错误"})
+                return
+
+            if path == "/health" and method == "GET":
+                await self._send_json(writer, HTTPStatus.OK, self._health())
+            elif path == "/ask" and method == "POST":
+                await self._handle_ask(body, writer)
+            elif path in ("/health", "/ask"):
+                await self._send_json(writer, HTTPStatus.METHOD_NOT_ALLOWED, {"error": "不支持的请求方法"})
+            else:
+                await self._send_json(writer, HTTPStatus.NOT_FOUND, {"error": "接口不存在"})
+        except (ConnectionError, asyncio.CancelledError):
+            logger.debug("客户端连接已断开")
+        except Exception as e:
+            logger.exception("处理HTTP请求时发生错误: %s", e)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> tuple:
+        """
+        Read the request line, headers and body; returns (method, path, body)
+        """
+        request_line = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+        method, target, _ = request_line.split(" ", 2)
+
+        headers = {}
+        while True:
+            line = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY_BYTES:
+            raise _HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "请求体过大")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], body
+
+    async def _handle_ask(self, body: bytes, writer: asyncio.StreamWriter):
+        try:
+            payload = json.loads(body.decode("utf-8") or "{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            await self._send_json(writer, HTTPStatus.BAD_REQUEST, {"error": "请求体不是合法的JSON"})
+            return
+
+        question = payload.get("question") if isinstance(payload, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            await self._send_json(writer, HTTPStatus.BAD_REQUEST, {"error": "缺少 question 字段"})
+            return
+        doc_ids = payload.get("doc_ids") or None
+        if doc_ids is not None and not (isinstance(doc_ids, list) and all(isinstance(d, str) for d in doc_ids)):
+            await self._send_json(writer, HTTPStatus.BAD_REQUEST, {"error": "doc_ids 必须是字符串列表"})
+            return
+
+        if not payload.get("stream"):
+            try:
+                answer = await self.qa_processor.aprocess_question(question, doc_ids=doc_ids)
+            except Exception as e:
+                await self._send_failure(writer, e)
+                return
+            await self._send_json(writer, HTTPStatus.OK, {"answer": answer})
+            return
+
+        deltas = self.qa_processor.astream_answer(question, doc_ids=doc_ids)
+        try:
+            # Wait for the first delta before committing to a 200, so failures in
+            # routing/retrieval still get a proper status code
+            try:
+                first = await deltas.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except Exception as e:
+                await self._send_failure(writer, e)
+                return
+
+            writer.write(_response_head(HTTPStatus.OK, {
+                "Content-Type": "text/event-stream; charset=utf-8",
+                "Cache-Control": "no-cache",
+            }))
+            if first is not None:
+                writer.write(_sse_event({"delta": first}))
+            try:
+                async for delta in deltas:
+                    writer.write(_sse_event({"delta": delta}))
+                    # Backpressure: a slow client slows generation instead of buffering it
+                    await writer.drain()
+            except ConnectionError:
+                raise
+            except Exception as e:
+                self._log_failure(e)
+                writer.write(_sse_event(self._failure_payload(e), event="error"))
+                await writer.drain()
+                return
+        finally:
+            # Closes the model stream early if the client went away
+            await deltas.aclose()
+        writer.write(_sse_event({}, event="done"))
+        await writer.drain()
+
+    async def _send_failure(self, writer: asyncio.StreamWriter, error: Exception):
+        """
+        Answer a failed question: 503 with Retry-After for an open circuit, 500 otherwise
+        """
+        self._log_failure(error)
+        payload = self._failure_payload(error)
+        if isinstance(error, CircuitOpenError):
+            await self._send_json(writer, HTTPStatus.SERVICE_UNAVAILABLE, payload,
+                                  {"Retry-After": str(payload["retry_after"])})
+        else:
+            await self._send_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, payload)
+
+    def _failure_payload(self, error: Exception) -> dict:
+        if isinstance(error, CircuitOpenError):
+            return {
+                "error": "当前服务繁忙，请稍后再试。",
+                "retry_after": math.ceil(self.qa_processor.governor.recovery_timeout),
+            }
+        return {"error": "抱歉，处理问题时出现了错误，请稍后重试。"}
+
+    @staticmethod
+    def _log_failure(error: Exception):
+        if isinstance(error, CircuitOpenError):
+            logger.error("模型服务熔断，拒绝处理问题: %s", error)
+        else:
+            logger.error("处理问题时发生错误: %s", error, exc_info=error)
+
+    def _health(self) -> dict:
+        vector_store = self.qa_processor.vector_store
+        return {
+            "status": "ok",
+            "documents": len(vector_store.documents()) if vector_store is not None else 0,
+            "faqs": vector_store.doc_counter if vector_store is not None else 0,
+            "governors": get_all_governor_stats(),
+            "prompt_cache": prompt_cache_stats.snapshot(),
+            "speculation": dict(self.qa_processor.speculation_stats),
+        }
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: HTTPStatus, payload: dict, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(_response_head(status, {
+            "Content-Type": "application/json; charset=utf-8",
+            "Content-Length": str(len(body)),
+            **(headers or {}),
+        }))
+        writer.write(body)
+        await writer.drain()
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _response_head(status: HTTPStatus, headers: dict) -> bytes:
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    lines.append("Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def _sse_event(data: dict, event: str = None) -> bytes:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def load_snapshot_knowledge_base(snapshot_dir: str) -> SessionKnowledgeBase:
+    """
+    Build a knowledge base from every snapshot in snapshot_dir, through the
+    shared index registry. Document ids are the snapshots' content hashes.
+    """
+    knowledge_base = SessionKnowledgeBase()
+    registry = get_index_registry()
+    for path in sorted(glob.glob(os.path.join(snapshot_dir, "*.tdqa"))):
+        content_hash = os.path.splitext(os.path.basename(path))[0]
+        try:
+            lease = registry.acquire(content_hash, lambda vector_store, path=path: vector_store.import_snapshot(path))
+        except Exception as e:
+            logger.warning("加载知识库快照 %s 失败，已跳过: %s", path, e)
+            continue
+        knowledge_base.add_document(lease, content_hash)
+    logger.info("从 %s 加载了 %s 个文档，共 %s 个FAQ对", snapshot_dir, len(knowledge_base.documents()), knowledge_base.doc_counter)
+    return knowledge_base
+
+
+async def serve(host: str, port: int, qa_processor: QAProcessor):
+    """
+    Serve the QA pipeline until cancelled
+    """
+    server = await QAServer(qa_processor).start(host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="智能文档问答HTTP服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--snapshot-dir", default=None, help="知识库快照目录，默认读取 KB_SNAPSHOT_DIR")
+    args = parser.parse_args()
+
+    setup_logging()
+    try:
+        load_env_vars()
+        qa_processor = QAProcessor()
+        snapshot_dir = args.snapshot_dir or get_snapshot_dir()
+        if snapshot_dir and os.path.isdir(snapshot_dir):
+            qa_processor.set_vector_store(load_snapshot_knowledge_base(snapshot_dir))
+        else:
+            logger.warning("未找到知识库快照目录，服务将以空知识库启动")
+        asyncio.run(serve(args.host, args.port, qa_processor))
+    except KeyboardInterrupt:
+        logger.info("问答HTTP服务已停止")
+    finally:
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
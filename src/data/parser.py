@@ -1,22 +1,49 @@
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from pathlib import Path
+import bisect
+import math
+import re
 import chardet
 
 
+# 页眉页脚检测：每页首尾各取几行作为候选，出现在足够多页面上的即视为页眉页脚
+EDGE_LINES = 2
+MIN_REPEAT_RATIO = 0.4
+MIN_REPEAT_PAGES = 3
+# 断行修复：行长达到本页最长行的这一比例才视为排版自动换行
+WRAP_WIDTH_RATIO = 0.7
+MIN_WRAP_WIDTH = 10
+
+
 class DocumentParser:
     """
     Document parser class that handles PDF and TXT file parsing using LangChain
     """
     
+    def __init__(self):
+        # Character offset in the parsed text where each page starts
+        self.page_starts = [0]
+        # What the PDF cleanup stage removed from the last parsed document
+        self.cleanup_stats = {"removed_chars": 0, "removed_lines": 0}
+    
     def parse_pdf(self, file_path: str) -> str:
         """
-        Parse PDF file and extract text content using LangChain
+        Parse PDF file and extract text content using LangChain.
+        Running headers, footers and page numbers are stripped and broken
+        lines re-joined before the pages are combined.
         """
         try:
             loader = PyPDFLoader(file_path)
             documents = loader.load()
-            # Combine all pages' text
-            text_content = " ".join([doc.page_content for doc in documents])
+            raw_pages = [doc.page_content for doc in documents]
+            pages, removed_lines = _clean_pages(raw_pages)
+            self.cleanup_stats = {
+                "removed_chars": sum(map(len, raw_pages)) - sum(map(len, pages)),
+                "removed_lines": removed_lines,
+            }
+            # Combine all pages' text; page_starts refer to the cleaned text
+            self.page_starts = _page_starts(pages, "\n")
+            text_content = "\n".join(pages)
             return text_content
         except Exception as e:
             raise Exception(f"PDF parsing failed: {str(e)}")
@@ -25,6 +52,8 @@ class DocumentParser:
         """
         Parse TXT file with encoding detection using LangChain
         """
+        self.page_starts = [0]
+        self.cleanup_stats = {"removed_chars": 0, "removed_lines": 0}
         try:
             # First, detect encoding
             with open(file_path, 'rb') as file:
@@ -54,6 +83,127 @@ class DocumentParser:
             raise Exception(f"TXT parsing failed: {str(e)}")
 
 
+_INLINE_SPACE = re.compile(r"[ \t\u3000\xa0]+")
+_DIGITS = re.compile(r"\d+")
+_CJK = "\u3400-\u9fff\uf900-\ufaff"
+# 行尾为汉字或句中标点、下一行以汉字开头：PDF排版造成的断行
+_CJK_BREAK_END = re.compile(f"[{_CJK}，、（《“‘]$")
+_CJK_BREAK_START = re.compile(f"^[{_CJK}（《“‘]")
+_HYPHEN_BREAK = re.compile(r"[A-Za-z]-$")
+_LATIN_BREAK_END = re.compile(r"[A-Za-z,]$")
+_LATIN_BREAK_START = re.compile(r"^[a-z]")
+_WIDE_CHAR = re.compile(f"[{_CJK}\u3000-\u303f\uff00-\uffef]")
+
+
+def _clean_pages(pages: list) -> tuple:
+    """
+    Strip repeated headers/footers from each page, normalize whitespace and
+    re-join broken lines. Returns (cleaned_pages, removed_line_count).
+    """
+    page_lines = [
+        [line for line in (_INLINE_SPACE.sub(" ", raw).strip() for raw in page.splitlines()) if line]
+        for page in pages
+    ]
+    boilerplate = _repeated_edge_lines(page_lines)
+    
+    cleaned = []
+    removed = 0
+    for lines in page_lines:
+        kept = []
+        edge = _edge_size(lines)
+        for i, line in enumerate(lines):
+            at_edge = i < edge or i >= len(lines) - edge
+            if at_edge and _edge_key(line) in boilerplate:
+                removed += 1
+                continue
+            kept.append(line)
+        cleaned.append(_join_broken_lines(kept))
+    return cleaned, removed
+
+
+def _repeated_edge_lines(page_lines: list) -> set:
+    """
+    Keys of lines found at the top or bottom of enough pages to be running
+    headers, footers or page numbers
+    """
+    if len(page_lines) < MIN_REPEAT_PAGES:
+        return set()
+    counts = {}
+    for lines in page_lines:
+        edge = _edge_size(lines)
+        candidates = lines[:edge] + lines[len(lines) - edge:]
+        for key in {_edge_key(line) for line in candidates}:
+            counts[key] = counts.get(key, 0) + 1
+    min_pages = max(MIN_REPEAT_PAGES, math.ceil(len(page_lines) * MIN_REPEAT_RATIO))
+    return {key for key, count in counts.items() if count >= min_pages}
+
+
+def _edge_size(lines: list) -> int:
+    """
+    Number of lines at each end of a page treated as header/footer candidates;
+    short pages always keep at least one line of body text out of reach
+    """
+    return min(EDGE_LINES, (len(lines) - 1) // 2)
+
+
+def _edge_key(line: str) -> str:
+    """
+    Compare header/footer candidates with numbers masked, so "第 3 页" matches "第 4 页"
+    """
+    return _DIGITS.sub("#", line)
+
+
+def _join_broken_lines(lines: list) -> str:
+    """
+    Join lines split by PDF layout: hyphenated words, and Latin or CJK text
+    wrapped mid-sentence. Only lines filling most of the page width count as
+    wrapped, so headings and list items keep their line breaks.
+    """
+    wrap_width = max((_display_width(line) for line in lines), default=0) * WRAP_WIDTH_RATIO
+    text = ""
+    previous = ""
+    for line in lines:
+        wrapped = _display_width(previous) >= max(wrap_width, MIN_WRAP_WIDTH)
+        if not text:
+            text = line
+        elif _HYPHEN_BREAK.search(previous) and _LATIN_BREAK_START.match(line):
+            text = text[:-1] + line
+        elif wrapped and _CJK_BREAK_END.search(previous) and _CJK_BREAK_START.match(line):
+            text += line
+        elif wrapped and _LATIN_BREAK_END.search(previous) and _LATIN_BREAK_START.match(line):
+            text += " " + line
+        else:
+            text += "\n" + line
+        previous = line
+    return text
+
+
+def _display_width(line: str) -> int:
+    """
+    Line width with CJK and full-width characters counted twice
+    """
+    return len(line) + len(_WIDE_CHAR.findall(line))
+
+
+def _page_starts(pages: list, separator: str) -> list:
+    """
+    Offsets at which each page begins once pages are joined with separator
+    """
+    starts = []
+    offset = 0
+    for page in pages:
+        starts.append(offset)
+        offset += len(page) + len(separator)
+    return starts or [0]
+
+
+def page_of(page_starts: list, offset: int) -> int:
+    """
+    1-based page number containing a character offset
+    """
+    return max(1, bisect.bisect_right(page_starts, offset))
+
+
 if __name__ == "__main__":
     parser = DocumentParser()
     # Example usage would go here
\ No newline at end of file
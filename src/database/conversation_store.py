@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from src.utils.logger import get_logger
+
+
+# 设置日志
+logger = get_logger("database.conversation_store")
+
+
+class ConversationStore:
+    """
+    SQLite-backed chat history, so conversations survive restarts without
+    being held in session memory
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id TEXT NOT NULL REFERENCES conversations(id),
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_messages_conversation
+                    ON messages(conversation_id, id);
+            """)
+        logger.info("对话存储已就绪: %s", db_path)
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per operation keeps the store safe to share across sessions
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create_conversation(self) -> str:
+        """
+        Create a new conversation and return its id
+        """
+        conversation_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO conversations (id, created_at) VALUES (?, ?)",
+                (conversation_id, time.time())
+            )
+        logger.debug("创建新对话: %s", conversation_id)
+        return conversation_id
+
+    def conversation_exists(self, conversation_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return row is not None
+
+    def list_conversations(self, limit: int = 20) -> list:
+        """
+        Get the most recently created conversations with their message counts, newest first
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT c.id, c.created_at, COUNT(m.id) FROM conversations c "
+                "LEFT JOIN messages m ON m.conversation_id = c.id "
+                "GROUP BY c.id ORDER BY c.created_at DESC, c.rowid DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [{"id": row[0], "created_at": row[1], "message_count": row[2]} for row in rows]
+
+    def append_message(self, conversation_id: str, role: str, content: str) -> dict:
+        """
+        Persist a message and return it with its id
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                (conversation_id, role, content, time.time())
+            )
+        return {"id": cursor.lastrowid, "role": role, "content": content}
+
+    def update_message(self, message_id: int, content: str):
+        """
+        Replace the content of a message, e.g. a regenerated answer
+        """
+        with self._connect() as conn:
+            conn.execute("UPDATE messages SET content = ? WHERE id = ?", (content, message_id))
+
+    def recent_messages(self, conversation_id: str, limit: int) -> list:
+        """
+        Get the latest `limit` messages in chronological order
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, role, content FROM messages WHERE conversation_id = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (conversation_id, limit)
+            ).fetchall()
+        return [_to_message(row) for row in reversed(rows)]
+
+    def messages_before(self, conversation_id: str, before_id: int, limit: int) -> list:
+        """
+        Get one page of messages older than `before_id`, in chronological order
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, role, content FROM messages WHERE conversation_id = ? AND id < ? "
+                "ORDER BY id DESC LIMIT ?",
+                (conversation_id, before_id, limit)
+            ).fetchall()
+        return [_to_message(row) for row in reversed(rows)]
+
+    def count_messages(self, conversation_id: str) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0]
+
+
+def _to_message(row) -> dict:
+    return {"id": row[0], "role": row[1], "content": row[2]}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store(db_path: str) -> ConversationStore:
+    """
+    Get the process-wide conversation store
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore(db_path)
+        return _store
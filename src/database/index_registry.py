@@ -0,0 +1,273 @@
+import threading
+import time
+import weakref
+from src.database.vector_store import VectorStoreManager
+from src.utils.config import get_index_registry_settings
+from src.utils.logger import get_logger
+
+
+# 设置日志
+logger = get_logger("database.index_registry")
+
+
+class _IndexEntry:
+    def __init__(self, content_hash: str):
+        self.content_hash = content_hash
+        self.vector_store = None
+        self.ref_count = 0
+        self.last_used = time.monotonic()
+        self.ready = threading.Event()
+        self.error = None
+
+
+class IndexLease:
+    """
+    A session's reference to a shared document index.
+    The reference is dropped on release() or when the lease is garbage
+    collected, e.g. when the Streamlit session goes away.
+    """
+
+    def __init__(self, registry, entry: _IndexEntry, created: bool):
+        self.content_hash = entry.content_hash
+        self.vector_store = entry.vector_store
+        self.created = created
+        self._finalizer = weakref.finalize(self, registry.release, entry.content_hash)
+
+    def release(self):
+        self._finalizer()
+
+
+class IndexRegistry:
+    """
+    Process-level registry of read-only FAQ indexes keyed by document content hash.
+
+    Sessions uploading the same document share one index. Indexes with no
+    remaining leases are evicted after an idle TTL, or earlier (least recently
+    used first) when the total number of stored vectors passes a high-water mark.
+    """
+
+    def __init__(self, idle_ttl: float, max_vectors: int):
+        self.idle_ttl = idle_ttl
+        self.max_vectors = max_vectors
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop_sweeper = threading.Event()
+
+    def acquire(self, content_hash: str, builder) -> IndexLease:
+        """
+        Get a lease on the index for content_hash, calling builder(vector_store)
+        to populate a new index if none exists yet. Concurrent acquirers of a
+        document being built wait for the first builder instead of building again.
+        """
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            created = entry is None
+            if created:
+                entry = _IndexEntry(content_hash)
+                self._entries[content_hash] = entry
+            entry.ref_count += 1
+
+        if created:
+            vector_store = None
+            try:
+                vector_store = VectorStoreManager()
+                builder(vector_store)
+                vector_store.freeze()
+                entry.vector_store = vector_store
+                logger.info("新建共享索引 %s，共 %s 条向量", content_hash[:12], vector_store.doc_counter)
+            except Exception as e:
+                # Never share a failed or partial build: the next acquirer builds again
+                entry.error = e
+                with self._lock:
+                    self._entries.pop(content_hash, None)
+                if vector_store is not None:
+                    vector_store.drop()
+                raise
+            finally:
+                entry.ready.set()
+        else:
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+            logger.info("复用共享索引 %s，当前引用数 %s", content_hash[:12], entry.ref_count)
+
+        entry.last_used = time.monotonic()
+        lease = IndexLease(self, entry, created)
+        self.evict()
+        return lease
+
+    def release(self, content_hash: str):
+        """
+        Drop one reference to an index
+        """
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is None:
+                return
+            entry.ref_count = max(0, entry.ref_count - 1)
+            entry.last_used = time.monotonic()
+            logger.debug("释放共享索引 %s，剩余引用数 %s", content_hash[:12], entry.ref_count)
+        self.evict()
+
+    def evict(self):
+        """
+        Drop unreferenced indexes that are idle past the TTL or over the high-water mark
+        """
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            idle = [
+                entry for entry in self._entries.values()
+                if entry.ref_count == 0 and entry.ready.is_set() and entry.vector_store is not None
+            ]
+            idle.sort(key=lambda entry: entry.last_used)
+
+            total_vectors = self._total_vectors()
+            for entry in idle:
+                expired = now - entry.last_used >= self.idle_ttl
+                over_limit = total_vectors > self.max_vectors
+                if not expired and not over_limit:
+                    continue
+                del self._entries[entry.content_hash]
+                total_vectors -= entry.vector_store.doc_counter
+                evicted.append(entry)
+
+        for entry in evicted:
+            logger.info("回收空闲索引 %s（%s 条向量）", entry.content_hash[:12], entry.vector_store.doc_counter)
+            entry.vector_store.drop()
+
+    def start_sweeper(self, interval: float):
+        """
+        Run evict() every interval seconds from a daemon thread, so idle
+        indexes expire even when no session acquires or releases one
+        """
+        if self._sweeper is not None:
+            return
+        self._stop_sweeper.clear()
+
+        def sweep():
+            while not self._stop_sweeper.wait(interval):
+                try:
+                    self.evict()
+                except Exception as e:
+                    logger.warning("定期回收空闲索引失败: %s", e)
+
+        self._sweeper = threading.Thread(target=sweep, name="index-registry-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        if self._sweeper is None:
+            return
+        self._stop_sweeper.set()
+        self._sweeper.join()
+        self._sweeper = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "indexes": len(self._entries),
+                "referenced": sum(1 for entry in self._entries.values() if entry.ref_count > 0),
+                "vectors": self._total_vectors(),
+                "max_vectors": self.max_vectors,
+            }
+
+    def _total_vectors(self) -> int:
+        return sum(
+            entry.vector_store.doc_counter
+            for entry in self._entries.values() if entry.vector_store is not None
+        )
+
+
+class SessionKnowledgeBase:
+    """
+    A session's view over the shared indexes of the documents it uploaded.
+    Exposes the same search interface as VectorStoreManager.
+    """
+
+    def __init__(self):
+        self._leases = {}
+        self._names = {}
+        # Bumped whenever the set of documents changes, to invalidate cached retrievals
+        self.revision = 0
+
+    def has_document(self, content_hash: str) -> bool:
+        return content_hash in self._leases
+
+    def add_document(self, lease: IndexLease, name: str):
+        if lease.content_hash in self._leases:
+            lease.release()
+            return
+        self._leases[lease.content_hash] = lease
+        self._names[lease.content_hash] = name
+        self.revision += 1
+
+    def find_document(self, name: str):
+        """
+        Content hash of the document uploaded under this file name, if any
+        """
+        for content_hash, document_name in self._names.items():
+            if document_name == name:
+                return content_hash
+        return None
+
+    def get_vector_store(self, content_hash: str):
+        lease = self._leases.get(content_hash)
+        return lease.vector_store if lease is not None else None
+
+    def remove_document(self, content_hash: str):
+        lease = self._leases.pop(content_hash, None)
+        self._names.pop(content_hash, None)
+        if lease is not None:
+            lease.release()
+            self.revision += 1
+
+    def documents(self) -> dict:
+        """
+        Content hash -> file name of every document in the knowledge base
+        """
+        return dict(self._names)
+
+    @property
+    def doc_counter(self) -> int:
+        return sum(lease.vector_store.doc_counter for lease in self._leases.values())
+
+    def similarity_search(self, query: str, top_k: int = 5, doc_ids: list = None) -> list:
+        """
+        Search the selected document indexes (all if doc_ids is empty) and merge
+        the results by relevance score. Each document is its own partition, so
+        the cost scales with the selected documents only.
+        """
+        if doc_ids:
+            stores = [self._leases[doc_id].vector_store for doc_id in doc_ids if doc_id in self._leases]
+        else:
+            stores = [lease.vector_store for lease in self._leases.values()]
+        if not stores:
+            return []
+        
+        # Embed once and reuse the vector for every partition
+        embedding = stores[0].embed_query(query)
+        results = []
+        for vector_store in stores:
+            results.extend(vector_store.similarity_search_by_vector(embedding, top_k=top_k))
+        results.sort(key=lambda faq: faq["relevance_score"], reverse=True)
+        return results[:top_k]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_index_registry() -> IndexRegistry:
+    """
+    Get the process-wide index registry
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            settings = get_index_registry_settings()
+            _registry = IndexRegistry(**settings)
+            # Check often enough that an index outlives its TTL by at most a quarter of it
+            _registry.start_sweeper(max(1.0, min(60.0, settings["idle_ttl"] / 4)))
+            logger.info("初始化索引注册表: %s", settings)
+        return _registry
@@ -1,33 +1,73 @@
+import hashlib
+import json
+import math
 import os
+import struct
+import time
 import chromadb
+import numpy as np
 from chromadb.config import Settings
 from langchain_chroma import Chroma
 from langchain_community.embeddings.dashscope import DashScopeEmbeddings
 from langchain_core.documents import Document
+from src.utils.call_governor import get_governor
+from src.utils.logger import get_logger
 import uuid
 
 
+# 设置日志
+logger = get_logger("database.vector_store")
+
+EMBEDDING_MODEL = "text-embedding-v1"
+
+# 知识库快照格式：魔数 + 版本 + JSON头 + FAQ记录(JSON) + 连续的float32向量块
+SNAPSHOT_MAGIC = b"TDQASNAP"
+SNAPSHOT_VERSION = 1
+# 快照头必需字段及其类型，整数字段须为非负整数
+SNAPSHOT_HEADER_FIELDS = {"embedding_model": str, "count": int, "dim": int, "records_size": int, "checksum": str}
+# Chroma单次写入的记录数上限以内分批导入
+SNAPSHOT_IMPORT_BATCH = 4000
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a knowledge-base snapshot is malformed or incompatible
+    """
+
+
 class VectorStoreManager:
     """
     Manages vector storage using Chroma and DashScope embeddings
     """
 
     def __init__(self):
+        self.embedding_model = EMBEDDING_MODEL
         self.embeddings = DashScopeEmbeddings(
-            model="text-embedding-v1",
+            model=self.embedding_model,
             dashscope_api_key=os.getenv("DASHS_API_KEY")
         )
         self.collection_name = "faq_collection_" + str(uuid.uuid4())
         self.vector_store = Chroma(
             collection_name=self.collection_name,
-            embedding_function=self.embeddings
+            embedding_function=self.embeddings,
+            # 固定使用l2距离，_relevance_from_distance 依赖这一点
+            collection_configuration={"hnsw": {"space": "l2"}}
         )
         self.doc_counter = 0
+        # Embedding calls share the process-wide DashScope governor
+        self.governor = get_governor("dashscope")
+        # Shared indexes are frozen once built
+        self.read_only = False
+        # Hashes of every window of the source document, including windows that yielded no FAQ
+        self.source_window_hashes = set()
 
-    def add_faqs(self, faqs: list):
+    def add_faqs(self, faqs: list, doc_id: str = ""):
         """
-        Add FAQs to the vector store
+        Add FAQs to the vector store, tagged with their document, page and window
         """
+        if self.read_only:
+            raise RuntimeError("向量存储为只读共享索引，不能再添加FAQ")
+
         documents = []
         metadatas = []
 
@@ -38,7 +78,12 @@ class VectorStoreManager:
                 metadata={
                     "question": faq.get("问题", ""),
                     "answer": faq.get("答案", ""),
-                    "id": str(self.doc_counter)
+                    "id": str(self.doc_counter),
+                    "doc_id": doc_id,
+                    "page": faq.get("page", 1),
+                    "window_hash": faq.get("window_hash", ""),
+                    "window_start": faq.get("window_start", 0),
+                    "window_end": faq.get("window_end", 0)
                 }
             )
             documents.append(doc)
@@ -46,29 +91,280 @@ class VectorStoreManager:
 
         # Add documents to vector store
         if documents:
-            self.vector_store.add_documents(documents)
+            self.governor.call(self.vector_store.add_documents, documents)
 
-    def similarity_search(self, query: str, top_k: int = 5) -> list:
+    def similarity_search(self, query: str, top_k: int = 5, doc_ids: list = None) -> list:
         """
-        Perform similarity search in the vector store
+        Perform similarity search in the vector store, optionally restricted to some documents
         """
-        results = self.vector_store.similarity_search_with_relevance_scores(
-            query,
-            k=top_k
+        return self.similarity_search_by_vector(self.embed_query(query), top_k, doc_ids)
+
+    def embed_query(self, query: str) -> list:
+        """
+        Embed a query once so it can be searched against several stores
+        """
+        return self.governor.call(self.embeddings.embed_query, query)
+
+    def similarity_search_by_vector(self, embedding: list, top_k: int = 5, doc_ids: list = None) -> list:
+        """
+        Search with a precomputed query embedding; doc_ids restricts the
+        candidate set through a metadata filter
+        """
+        where = _doc_filter(doc_ids)
+        results = self.vector_store.similarity_search_by_vector_with_relevance_scores(
+            embedding,
+            k=top_k,
+            filter=where
         )
 
         # Extract FAQ pairs from results
         faqs = []
-        for doc, score in results:
+        for doc, distance in results:
             faq_pair = {
                 "question": doc.metadata.get("question", ""),
                 "answer": doc.metadata.get("answer", ""),
-                "relevance_score": score
+                "relevance_score": _relevance_from_distance(distance),
+                "doc_id": doc.metadata.get("doc_id", ""),
+                "page": doc.metadata.get("page", 1)
             }
             faqs.append(faq_pair)
 
         return faqs
 
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Delete all FAQs of a document in one operation
+        """
+        if self.read_only:
+            raise RuntimeError("向量存储为只读共享索引，不能删除FAQ")
+        where = {"doc_id": doc_id}
+        count = len(self.vector_store.get(where=where, include=[])["ids"])
+        if count:
+            self.vector_store.delete(where=where)
+            self.doc_counter -= count
+        return count
+
+    def questions(self) -> list:
+        """
+        Questions of every stored FAQ
+        """
+        records = self.vector_store.get(include=["metadatas"])
+        return [(metadata or {}).get("question", "") for metadata in records["metadatas"]]
+
+    def window_hashes(self) -> dict:
+        """
+        Count of stored FAQs per source window hash
+        """
+        records = self.vector_store.get(include=["metadatas"])
+        counts = {}
+        for metadata in records["metadatas"]:
+            window_hash = (metadata or {}).get("window_hash", "")
+            counts[window_hash] = counts.get(window_hash, 0) + 1
+        return counts
+
+    def copy_windows_from(self, other: "VectorStoreManager", window_metadata: dict) -> int:
+        """
+        Copy the FAQs of the given windows, embeddings included, from another
+        store, so unchanged windows of a revised document need no new embedding calls.
+        window_metadata maps window hash to the metadata to update on the copies
+        (e.g. new doc_id and offsets).
+        """
+        if self.read_only:
+            raise RuntimeError("向量存储为只读共享索引，不能再添加FAQ")
+        window_hashes = list(window_metadata)
+        if not window_hashes:
+            return 0
+
+        records = other.vector_store.get(
+            where={"window_hash": {"$in": window_hashes}},
+            include=["embeddings", "metadatas", "documents"]
+        )
+        if not records["ids"]:
+            return 0
+
+        metadatas = []
+        for metadata in records["metadatas"]:
+            metadatas.append({
+                **metadata,
+                **window_metadata.get(metadata.get("window_hash"), {}),
+                "id": str(self.doc_counter)
+            })
+            self.doc_counter += 1
+        self._add_embedded_records(records["ids"], records["embeddings"], metadatas, records["documents"])
+        return len(records["ids"])
+
+    def _add_embedded_records(self, ids: list, embeddings, metadatas: list, documents: list):
+        """
+        Add records whose embeddings are already computed.
+
+        LangChain's Chroma wrapper has no public way to do this: add_texts and
+        add_documents always run the embedding function, and it offers no
+        add_embeddings. Writing to the underlying Chroma collection is the only
+        way to reuse stored vectors without paying for new embedding calls, so
+        that private access is kept to this one method.
+        """
+        self.vector_store._collection.add(
+            ids=ids,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            documents=documents
+        )
+
+    def export_snapshot(self, path: str) -> dict:
+        """
+        Write every FAQ record and its vector to a portable snapshot file.
+        The file is written to a temporary name and renamed, so readers never
+        see a partial snapshot.
+        """
+        records = self.vector_store.get(include=["embeddings", "metadatas", "documents"])
+        count = len(records["ids"])
+        vectors = np.asarray(records["embeddings"], dtype="<f4") if count else np.zeros((0, 0), dtype="<f4")
+        dim = int(vectors.shape[1]) if count else 0
+
+        record_bytes = json.dumps(
+            [
+                {"id": record_id, "document": document, "metadata": metadata}
+                for record_id, document, metadata in zip(records["ids"], records["documents"], records["metadatas"])
+            ],
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+        vector_bytes = vectors.tobytes()
+
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "embedding_model": self.embedding_model,
+            "count": count,
+            "dim": dim,
+            "records_size": len(record_bytes),
+            "checksum": hashlib.sha256(record_bytes + vector_bytes).hexdigest(),
+            "source_window_hashes": sorted(self.source_window_hashes),
+            "created_at": time.time(),
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(temp_path, "wb") as file:
+            file.write(SNAPSHOT_MAGIC)
+            file.write(struct.pack("<HI", SNAPSHOT_VERSION, len(header_bytes)))
+            file.write(header_bytes)
+            file.write(record_bytes)
+            file.write(vector_bytes)
+        os.replace(temp_path, path)
+
+        logger.info("导出知识库快照 %s: %s 条记录, 维度 %s", path, count, dim)
+        return header
+
+    def import_snapshot(self, path: str) -> dict:
+        """
+        Load FAQ records and vectors from a snapshot into this empty store,
+        without any LLM or embedding calls
+        """
+        if self.read_only:
+            raise RuntimeError("向量存储为只读共享索引，不能再添加FAQ")
+        if self.doc_counter:
+            raise RuntimeError("只能向空的向量存储导入快照")
+
+        with open(path, "rb") as file:
+            data = file.read()
+
+        if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"不是知识库快照文件: {path}")
+        offset = len(SNAPSHOT_MAGIC)
+        try:
+            version, header_size = struct.unpack_from("<HI", data, offset)
+            if version != SNAPSHOT_VERSION:
+                raise SnapshotError(f"不支持的快照版本: {version}")
+            offset += struct.calcsize("<HI")
+            header = json.loads(data[offset:offset + header_size].decode("utf-8"))
+            offset += header_size
+        except (struct.error, KeyError, TypeError, ValueError) as e:
+            # Truncated or hand-edited headers are reported like any other bad snapshot
+            raise SnapshotError(f"快照文件头损坏: {e!r}") from e
+        missing = [key for key in SNAPSHOT_HEADER_FIELDS if not isinstance(header, dict) or key not in header]
+        if missing:
+            raise SnapshotError(f"快照文件头缺少字段: {', '.join(missing)}")
+        invalid = [key for key, kind in SNAPSHOT_HEADER_FIELDS.items() if not _valid_header_field(header[key], kind)]
+        if invalid:
+            raise SnapshotError(f"快照文件头字段类型错误: {', '.join(invalid)}")
+
+        if header["embedding_model"] != self.embedding_model:
+            raise SnapshotError(
+                f"快照的嵌入模型 {header['embedding_model']} 与当前模型 {self.embedding_model} 不一致"
+            )
+
+        record_bytes = data[offset:offset + header["records_size"]]
+        vector_bytes = data[offset + header["records_size"]:]
+        if len(vector_bytes) != header["count"] * header["dim"] * 4:
+            raise SnapshotError("快照向量块长度不正确，文件可能已截断")
+        if hashlib.sha256(record_bytes + vector_bytes).hexdigest() != header["checksum"]:
+            raise SnapshotError("快照校验和不匹配，文件可能已损坏")
+
+        try:
+            records = json.loads(record_bytes.decode("utf-8"))
+        except ValueError as e:
+            raise SnapshotError(f"快照FAQ记录损坏: {e!r}") from e
+        if not isinstance(records, list) or len(records) != header["count"]:
+            raise SnapshotError("快照FAQ记录数与文件头不一致")
+        vectors = np.frombuffer(vector_bytes, dtype="<f4").reshape(header["count"], header["dim"])
+        for start in range(0, len(records), SNAPSHOT_IMPORT_BATCH):
+            batch = records[start:start + SNAPSHOT_IMPORT_BATCH]
+            self._add_embedded_records(
+                [record["id"] for record in batch],
+                vectors[start:start + len(batch)],
+                [record["metadata"] for record in batch],
+                [record["document"] for record in batch]
+            )
+        self.doc_counter = len(records)
+        self.source_window_hashes = set(header.get("source_window_hashes", []))
+
+        logger.info("导入知识库快照 %s: %s 条记录", path, len(records))
+        return header
+
+    def freeze(self):
+        """
+        Mark the store read-only so it can be shared between sessions
+        """
+        self.read_only = True
+
+    def drop(self):
+        """
+        Delete the underlying collection and release its memory
+        """
+        self.vector_store.delete_collection()
+
+
+def _relevance_from_distance(distance: float) -> float:
+    """
+    Convert an l2 distance from Chroma into a relevance score. This is the
+    same conversion LangChain uses for unit-normalised embeddings.
+    """
+    return 1.0 - distance / math.sqrt(2)
+
+
+def _valid_header_field(value, kind: type) -> bool:
+    """
+    Whether a snapshot header value has the expected type; ints must be non-negative
+    """
+    if kind is int:
+        # bool是int的子类，需单独排除
+        return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+    return isinstance(value, kind)
+
+
+def _doc_filter(doc_ids: list):
+    """
+    Chroma metadata filter selecting the given documents, or None for all
+    """
+    if not doc_ids:
+        return None
+    if len(doc_ids) == 1:
+        return {"doc_id": doc_ids[0]}
+    return {"doc_id": {"$in": list(doc_ids)}}
+
 
 if __name__ == "__main__":
     manager = VectorStoreManager()
@@ -1,7 +1,10 @@
 from langchain.chat_models import init_chat_model
 from langchain_core.prompts import ChatPromptTemplate
+from src.llm import prompts
 from src.utils.logger import get_logger
-from src.utils.config import get_api_key
+from src.utils.config import get_api_key, get_extraction_mode, get_prefilter_threshold
+from src.utils.call_governor import get_governor, CircuitOpenError
+import hashlib
 import json
 import re
 
@@ -12,7 +15,7 @@ logger = get_logger("llm.faq_extractor")
 
 class FAQExtractor:
     """
-    FAQ extractor using sliding window approach and DeepSeek Reasoner
+    FAQ extractor using content-defined sliding windows and DeepSeek Reasoner
     """
     
     def __init__(self):
@@ -30,17 +33,33 @@ class FAQExtractor:
                 model_provider="deepseek", 
                 temperature=0.1,  # 匹配原始温度设置
                 api_key=api_key,
-                base_url="https://api.deepseek.com"
+                base_url="https://api.deepseek.com",
+                # 重试与退避只由 CallGovernor 负责，SDK 自带重试会吞掉限流信号
+                max_retries=0
             )
             logger.debug("DeepSeek LLM模型初始化成功")
         except Exception as e:
-            logger.error(f"FAQ提取器初始化失败: {e}")
+            logger.error("FAQ提取器初始化失败: %s", e)
             raise
             
-        # 由于去掉了分词器，使用字符数进行窗口分割
+        # 所有DeepSeek调用共享同一个限流/重试/熔断控制器
+        self.governor = get_governor("deepseek")
+        
+        # 由于去掉了分词器，使用字符数进行窗口分割（窗口边界由内容决定，见 _create_windows）
         self.window_size = 4000  # 4000字符（约等于2000 tokens）
         self.overlap_size = 1000  # 1000字符重叠
-        logger.debug(f"窗口大小: {self.window_size}字符, 重叠大小: {self.overlap_size}字符")
+        logger.debug("窗口大小: %s字符, 重叠大小: %s字符", self.window_size, self.overlap_size)
+        
+        # 输出格式与按窗口累计的输出token、解析失败统计
+        self.extraction_mode = get_extraction_mode()
+        self.extraction_stats = {
+            "windows": 0, "faqs": 0, "parse_errors": 0, "output_tokens": 0, "provider_output_tokens": 0, "verbose_tokens": 0, "skipped_windows": 0,
+            "failed_windows": 0
+        }
+        logger.debug("FAQ提取模式: %s", self.extraction_mode)
+        
+        # 信息密度低于阈值的窗口（目录、参考文献、数据表等）不调用模型；默认关闭
+        self.density_threshold = get_prefilter_threshold()
     
     # llm call test code
     def test_llm_call(self, question: str) -> str:
@@ -53,7 +72,7 @@ class FAQExtractor:
         ])
         
         chain = prompt | self.llm
-        response = chain.invoke({})
+        response = self.governor.call(chain.invoke, {})
         
         return response.content
     
@@ -61,101 +80,385 @@ class FAQExtractor:
         """
         Extract FAQs using sliding window approach
         """
-        logger.info(f"开始提取FAQ，文本长度: {len(text)} 字符")
+        return list(self.stream_faqs(text))
+    
+    def stream_faqs(self, text: str, skip_window_hashes=None, seen_questions=None):
+        """
+        Yield validated, de-duplicated FAQs as soon as the model closes each object.
+        Each FAQ carries the hash and offsets of the window it came from; windows whose hash
+        is in skip_window_hashes (already extracted in an earlier revision) are skipped.
+        Questions in seen_questions (e.g. FAQs copied from that revision) are not yielded again.
+        """
+        logger.info("开始提取FAQ，文本长度: %s 字符", len(text))
+        skip_window_hashes = skip_window_hashes or set()
         
+        total = 0
         try:
             # Split text into windows
-            windows = self._create_sliding_windows(text)
-            logger.info(f"文本分割为 {len(windows)} 个窗口")
+            windows = self._create_windows(text)
+            logger.info("文本分割为 %s 个窗口", len(windows))
             
-            all_faqs = []
+            # Overlapping windows often yield the same question twice
+            seen_questions = {_normalize_question(question) for question in seen_questions or ()}
             for i, window in enumerate(windows):
-                logger.debug(f"处理第 {i+1}/{len(windows)} 个窗口")
-                faqs = self._extract_faqs_from_window(window)
-                all_faqs.extend(faqs)
-                logger.debug(f"窗口 {i+1} 提取到 {len(faqs)} 个FAQ对")
+                if window["hash"] in skip_window_hashes:
+                    logger.debug("窗口 %s 内容未变化，跳过提取", i+1)
+                    continue
+                if self.density_threshold > 0:
+                    density = _information_density(window["text"])
+                    if density < self.density_threshold:
+                        self.extraction_stats["skipped_windows"] += 1
+                        logger.debug("窗口 %s 信息密度 %.2f 低于阈值，跳过提取", i+1, density)
+                        continue
+                logger.debug("处理第 %s/%s 个窗口", i+1, len(windows))
+                window_count = 0
+                for faq in self._extract_faqs_from_window(window["text"]):
+                    key = _normalize_question(faq["问题"])
+                    if key in seen_questions:
+                        continue
+                    seen_questions.add(key)
+                    window_count += 1
+                    faq["window_hash"] = window["hash"]
+                    faq["window_start"] = window["start"]
+                    faq["window_end"] = window["end"]
+                    yield faq
+                total += window_count
+                logger.debug("窗口 %s 提取到 %s 个FAQ对", i+1, window_count)
             
-            logger.info(f"FAQ提取完成，共提取到 {len(all_faqs)} 个FAQ对")
-            return all_faqs
+            logger.info("FAQ提取完成，共提取到 %s 个FAQ对", total)
+            if self.extraction_stats["skipped_windows"]:
+                logger.info("预过滤累计跳过 %s 个低信息密度窗口", self.extraction_stats["skipped_windows"])
+            logger.info("输出统计: %s", self.extraction_report())
+            logger.info("DeepSeek调用状态: %s", self.governor.stats())
+            logger.info("前缀缓存统计: %s", prompts.prompt_cache_stats.snapshot())
             
         except Exception as e:
-            logger.exception(f"FAQ提取过程中发生错误: {e}")
-            return []
+            # A partial extraction must not pass for a complete one
+            logger.exception("FAQ提取过程中发生错误: %s", e)
+            raise
     
-    def _create_sliding_windows(self, text: str) -> list:
+    def extraction_report(self) -> dict:
         """
-        Create sliding windows from text using character count
+        Accumulated output tokens, estimated savings against the verbose
+        format, and parse-failure rate of the windows extracted so far.
+        output_tokens and verbose_tokens are both counted with the local
+        tokenizer so tokens_saved compares like with like; what the provider
+        billed is reported separately as provider_output_tokens.
+        """
+        stats = dict(self.extraction_stats)
+        attempts = stats["faqs"] + stats["parse_errors"]
+        stats["mode"] = self.extraction_mode
+        stats["tokens_saved"] = stats["verbose_tokens"] - stats["output_tokens"]
+        stats["parse_failure_rate"] = round(stats["parse_errors"] / attempts, 3) if attempts else 0.0
+        return stats
+    
+    def plan_windows(self, text: str) -> list:
+        """
+        Hash and character offsets of the windows the text would be split into
+        """
+        return [
+            {"hash": window["hash"], "start": window["start"], "end": window["end"]}
+            for window in self._create_windows(text)
+        ]
+    
+    def _create_windows(self, text: str) -> list:
+        """
+        Create overlapping windows from content-defined chunks.
+        Each window is a chunk prefixed with the sentence-aligned tail of the
+        previous chunk, so an edit only changes the windows around it.
         """
         windows = []
+        prev_start = 0
+        for start, end in self._content_defined_chunks(text):
+            window_start = start
+            if start > 0:
+                window_start = _snap_to_sentence_start(text, max(prev_start, start - self.overlap_size), start)
+            window_text = text[window_start:end]
+            if window_text.strip():
+                windows.append({
+                    "text": window_text,
+                    "hash": hashlib.sha1(window_text.encode("utf-8")).hexdigest(),
+                    "start": window_start,
+                    "end": end,
+                })
+            prev_start = start
+        return windows
+    
+    def _content_defined_chunks(self, text: str) -> list:
+        """
+        Split text into (start, end) chunks whose boundaries depend only on
+        nearby content: a rolling hash over the last few characters picks cut
+        candidates, which are then snapped to the next sentence end
+        """
+        max_chunk = self.window_size - self.overlap_size
+        min_chunk = max_chunk // 2
+        divisor = max_chunk // 3
+        chunks = []
         text_length = len(text)
         
-        start_idx = 0
-        while start_idx < text_length:
-            end_idx = min(start_idx + self.window_size, text_length)
-            window_text = text[start_idx:end_idx]
-            windows.append(window_text)
-            
-            # Move start index by window_size - overlap_size
-            start_idx += (self.window_size - self.overlap_size)
-            
-            # If the next window would be too small, break
-            if start_idx + self.overlap_size >= text_length:
-                # Add the remaining text as the final window if it's substantial
-                if end_idx < text_length:
-                    final_text = text[end_idx - self.overlap_size:]
-                    if len(final_text.strip()) > 0:
-                        windows.append(final_text)
-                break
+        start = 0
+        while start < text_length:
+            limit = min(text_length, start + max_chunk)
+            end = limit
+            rolling = 0
+            for i in range(start, limit):
+                rolling = (rolling * _HASH_BASE + ord(text[i])) & _HASH_MASK
+                if i - start >= _HASH_WINDOW:
+                    rolling = (rolling - ord(text[i - _HASH_WINDOW]) * _HASH_BASE_POW) & _HASH_MASK
+                if i + 1 - start >= min_chunk and rolling % divisor == 0:
+                    match = _SENTENCE_END.search(text, i + 1, limit)
+                    if match:
+                        end = match.end()
+                        break
+            else:
+                if limit < text_length:
+                    # No content-defined cut before max size: cut at the last sentence end
+                    last = None
+                    for last in _SENTENCE_END.finditer(text, start + min_chunk, limit):
+                        pass
+                    if last is not None:
+                        end = last.end()
+            chunks.append((start, end))
+            start = end
         
-        return windows
+        return chunks
     
-    def _extract_faqs_from_window(self, window_text: str) -> list:
+    def _extract_faqs_from_window(self, window_text: str):
         """
-        Extract FAQs from a single window of text using DeepSeek model
+        Extract FAQs from a single window of text using DeepSeek model,
+        yielding each FAQ as soon as its JSON object is complete
         """
-        # 构建提示词
-        prompt = f"""你是一个专业的FAQ提取助手。请从给定的文本中提取所有可能的问题-答案对。
+        if self.extraction_mode == "compact":
+            # JSON模式保证输出是合法JSON，短键名减少输出token
+            instruction = prompts.FAQ_EXTRACTION_COMPACT_INSTRUCTION
+            parser = StreamingFAQParser(question_key="q", answer_key="a")
+            kwargs = {"response_format": {"type": "json_object"}}
+        else:
+            instruction = prompts.FAQ_EXTRACTION_INSTRUCTION
+            parser = StreamingFAQParser()
+            kwargs = {}
+        # 固定前缀在前、窗口文本在后，便于命中DeepSeek前缀缓存
+        messages = prompts.build_messages(prompts.FAQ_EXTRACTION_SYSTEM, instruction, window_text)
+        
+        faqs = []
+        output = []
+        provider_output_tokens = 0
+        try:
+            # 流式调用模型，每个对象闭合后立即解析
+            for chunk in self.governor.stream(self.llm.stream, messages, stream_usage=True, **kwargs):
+                if chunk.usage_metadata:
+                    prompts.prompt_cache_stats.record(chunk)
+                    provider_output_tokens = chunk.usage_metadata.get("output_tokens") or provider_output_tokens
+                output.append(chunk.content)
+                for faq in parser.feed(chunk.content):
+                    faqs.append(faq)
+                    yield faq
+        except CircuitOpenError:
+            # No point sending the remaining windows while the provider is down
+            raise
+        except Exception as e:
+            # Keep whatever was parsed before the failure; callers decide from failed_windows
+            self.extraction_stats["failed_windows"] += 1
+            logger.error("LLM调用失败: %s", e)
+        parser.close()
+        
+        if parser.parsed_count == 0:
+            logger.warning("未在响应中找到有效的FAQ对象")
+        if parser.error_count:
+            logger.warning("窗口中有 %s 个对象解析失败，已保留 %s 个有效FAQ对", parser.error_count, parser.parsed_count)
+        self._record_window_output(faqs, "".join(output), provider_output_tokens, parser.error_count)
+    
+    def _record_window_output(self, faqs: list, output: str, provider_output_tokens: int, parse_errors: int):
+        """
+        Account a window's completion tokens against what the verbose format
+        would have produced for the same FAQs
+        """
+        # 两侧都用本地分词器计数，节省量才可比；服务商计费的token单独记录
+        output_tokens = prompts.count_tokens(output) if output else 0
+        # Only the FAQ fields: callers tag the yielded dicts with window metadata
+        verbose = [{"问题": faq["问题"], "答案": faq["答案"]} for faq in faqs]
+        verbose_tokens = prompts.count_tokens(json.dumps(verbose, ensure_ascii=False, indent=2)) if faqs else 0
+        
+        stats = self.extraction_stats
+        stats["windows"] += 1
+        stats["faqs"] += len(faqs)
+        stats["parse_errors"] += parse_errors
+        stats["output_tokens"] += output_tokens
+        stats["provider_output_tokens"] += provider_output_tokens
+        stats["verbose_tokens"] += verbose_tokens
+        logger.debug(
+            "窗口输出 %s tokens，冗长格式约 %s tokens，节省 %s tokens",
+            output_tokens, verbose_tokens, verbose_tokens - output_tokens
+        )
 
-请从以下文本中提取问题-答案对：
 
-{window_text}
+# 内容定义分块所用的滚动哈希参数
+_HASH_WINDOW = 32
+_HASH_BASE = 257
+_HASH_MASK = (1 << 32) - 1
+_HASH_BASE_POW = pow(_HASH_BASE, _HASH_WINDOW, 1 << 32)
 
-返回格式为JSON列表，例如：
-[
-  {{"问题": "示例问题1?", "答案": "示例答案1。"}},
-  {{"问题": "示例问题2?", "答案": "示例答案2。"}}
-]
+_SENTENCE_END = re.compile(r"[。！？!?；;]+[”’\"')）]*|\.(?=\s)|\n+")
 
-只返回JSON格式的内容，不要添加其他解释。"""
-        
-        try:
-            # 使用LangChain模型进行调用
-            response = self.llm.invoke(prompt)
-            logger.debug(f"LLM模型返回原始响应: {response.content}")
+
+def _snap_to_sentence_start(text: str, start: int, limit: int) -> int:
+    """
+    Move start forward to just after the first sentence end before limit
+    """
+    match = _SENTENCE_END.search(text, start, limit)
+    return match.end() if match and match.end() < limit else start
+
+
+# 信息密度评分所用的模式
+_LEADER = re.compile(r"[.．·…。]{3,}|[-_=]{3,}")
+_CLAUSE_PUNCT = re.compile(r"[。！？!?；;，,：:]|\.(?=\s)")
+_DIGIT = re.compile(r"\d")
+# 参考文献条目：[1] 编号、[J]/[M] 等文献类型标识、APA年份、卷(期):页码、DOI
+_CITATION = re.compile(
+    r"^\[\d+\]|\[[JMCDNRSPZ](?:/OL)?\]|\(\d{4}[a-z]?\)\.|\d{4}\s*[,，]\s*\d+\s*\(\d+\)\s*[:：]|doi\.org|et al\.",
+    re.IGNORECASE
+)
+_MIN_PROSE_LINE = 20
+# Prices, dates, phone numbers and specs stay well below this digit share; tables don't
+_DIGIT_RATIO_ALLOWANCE = 0.3
+
+
+def _information_density(text: str) -> float:
+    """
+    Cheap 0-1 estimate of how much running prose a window holds.
+
+    Combines clause punctuation per character, the share of text in long
+    lines and the share of distinct lines. Windows made mostly of digits
+    (numeric tables) or of citation lines (reference lists) are scaled down.
+    Tables of contents, reference lists and numeric tables score below 0.2;
+    prose and Q&A text, including text with prices, dates and specs, score above 0.5.
+    """
+    # Dot leaders of a table of contents are not sentence punctuation
+    lines = [_LEADER.sub(" ", line).strip() for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    if not lines:
+        return 0.0
+    body = "".join(lines)
+    chars = len(re.sub(r"\s", "", body))
+    if not chars:
+        return 0.0
+    
+    # Running prose has a clause mark roughly every 25 characters
+    punct_score = min(1.0, len(_CLAUSE_PUNCT.findall(" ".join(lines))) * 25 / chars)
+    line_chars = sum(len(line) for line in lines)
+    line_score = sum(len(line) for line in lines if len(line) >= _MIN_PROSE_LINE) / line_chars
+    unique_score = len(set(lines)) / len(lines)
+    
+    digit_ratio = len(_DIGIT.findall(body)) / chars
+    digit_factor = max(0.0, min(1.0, 1 - (digit_ratio - _DIGIT_RATIO_ALLOWANCE) / _DIGIT_RATIO_ALLOWANCE))
+    citation_factor = 1 - sum(1 for line in lines if _CITATION.search(line)) / len(lines)
+    return digit_factor * citation_factor * (0.6 * punct_score + 0.2 * line_score + 0.2 * unique_score)
+
+
+def _normalize_question(question: str) -> str:
+    """
+    Normalize a question for duplicate detection
+    """
+    return re.sub(r"[\s？?。.!！，,]", "", question).lower()
+
+
+class StreamingFAQParser:
+    """
+    Incremental parser that emits FAQ objects from a streamed JSON list.
+
+    Objects are decoded one at a time as soon as their closing brace arrives,
+    so a truncated or malformed tail only loses the object it belongs to.
+    Only objects whose direct parent is an array are emitted, which also
+    covers a list wrapped in an object such as {"f": [...]}. Objects are read
+    with question_key/answer_key and emitted as {"问题", "答案"}.
+    """
+    
+    def __init__(self, question_key: str = "问题", answer_key: str = "答案"):
+        self.question_key = question_key
+        self.answer_key = answer_key
+        self.parsed_count = 0
+        self.error_count = 0
+        self._stack = []  # open containers: "[" or "{"
+        self._in_string = False
+        self._escaped = False
+        self._buffer = []  # characters of the object currently being collected
+        self._collecting = False
+        self._object_depth = 0
+    
+    def feed(self, chunk: str) -> list:
+        """
+        Consume a chunk of model output and return the FAQs it completed
+        """
+        completed = []
+        for char in chunk or "":
+            if self._collecting:
+                self._buffer.append(char)
             
-            # Extract JSON from response
-            try:
-                # Look for JSON in the response
-                json_match = re.search(r'\[.*\]', response.content, re.DOTALL)
-                if json_match:
-                    faq_json = json_match.group(0)
-                    faqs = json.loads(faq_json)
-                    # Validate FAQ format
-                    validated_faqs = []
-                    for faq in faqs:
-                        if isinstance(faq, dict) and "问题" in faq and "答案" in faq:
-                            validated_faqs.append(faq)
-                    return validated_faqs
-                else:
-                    logger.warning("未在响应中找到JSON格式内容")
-                    return []
-            except (json.JSONDecodeError, KeyError) as e:
-                logger.error(f"JSON解析错误: {e}")
-                return []
-                
-        except Exception as e:
-            logger.error(f"LLM调用失败: {e}")
-            return []
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            
+            if char == '"':
+                # Strings outside any container (prose around the JSON) are ignored
+                if self._stack:
+                    self._in_string = True
+            elif char == "[":
+                self._stack.append("[")
+            elif char == "{":
+                if not self._collecting and self._stack and self._stack[-1] == "[":
+                    self._collecting = True
+                    self._buffer = ["{"]
+                    self._object_depth = len(self._stack) + 1
+                self._stack.append("{")
+            elif char in "]}":
+                if self._stack:
+                    self._stack.pop()
+                if self._collecting and char == "}" and len(self._stack) + 1 == self._object_depth:
+                    faq = self._decode("".join(self._buffer))
+                    if faq is not None:
+                        completed.append(faq)
+                    self._collecting = False
+                    self._buffer = []
+        return completed
+    
+    def close(self):
+        """
+        End of stream: an object still being collected was cut off (max tokens
+        or a stream error) and counts as a parse failure
+        """
+        if self._collecting:
+            self.error_count += 1
+            logger.debug("流结束时FAQ对象未闭合，计为解析失败")
+        self._collecting = False
+        self._buffer = []
+    
+    def _decode(self, raw: str):
+        """
+        Decode and validate one FAQ object, or return None
+        """
+        try:
+            faq = json.loads(raw)
+        except json.JSONDecodeError as e:
+            self.error_count += 1
+            logger.debug("FAQ对象解析失败: %s", e)
+            return None
+        
+        if not isinstance(faq, dict):
+            self.error_count += 1
+            return None
+        question = faq.get(self.question_key)
+        answer = faq.get(self.answer_key)
+        if isinstance(question, str) and isinstance(answer, str) and question.strip() and answer.strip():
+            self.parsed_count += 1
+            return {"问题": question.strip(), "答案": answer.strip()}
+        
+        self.error_count += 1
+        return None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+import threading
+from src.utils.logger import get_logger
+
+
+# 设置日志
+logger = get_logger("llm.prompts")
+
+
+# DeepSeek的上下文缓存按请求前缀命中：系统提示与任务说明保持逐字不变，
+# 可变内容（用户问题、文档片段、参考信息）一律放在消息末尾。
+
+FAQ_EXTRACTION_SYSTEM = "你是一个专业的FAQ提取助手。请从给定的文本中提取所有可能的问题-答案对。"
+FAQ_EXTRACTION_INSTRUCTION = """返回格式为JSON列表，例如：
+[
+  {"问题": "示例问题1?", "答案": "示例答案1。"},
+  {"问题": "示例问题2?", "答案": "示例答案2。"}
+]
+
+只返回JSON格式的内容，不要添加其他解释。
+
+请从以下文本中提取问题-答案对："""
+
+# 紧凑模式：配合JSON模式输出，短键名可显著减少输出token（DeepSeek要求提示词中出现"json"）
+FAQ_EXTRACTION_COMPACT_INSTRUCTION = """以json对象返回，键f为问题-答案对列表，q为问题，a为答案，例如：
+{"f":[{"q":"示例问题1?","a":"示例答案1。"},{"q":"示例问题2?","a":"示例答案2。"}]}
+
+不要输出多余的空格和换行。
+
+请从以下文本中提取问题-答案对："""
+
+QUESTION_DETECTION_SYSTEM = "你是一个问题识别助手。请判断输入是否为提问句。"
+QUESTION_DETECTION_INSTRUCTION = "判断以下句子是否为提问句，请只回答：是 或 否\n\n句子："
+
+CALCULATION_DETECTION_SYSTEM = "你是一个问题分类助手。请判断输入是否为数学计算问题。"
+CALCULATION_DETECTION_INSTRUCTION = "判断以下问题是否为数学计算问题，请只回答：是 或 否\n\n问题："
+
+CHITCHAT_SYSTEM = "你是一个友好的聊天助手。请以轻松友好的方式回应用户的非问题性话语。"
+CHITCHAT_INSTRUCTION = "请友好地回应："
+
+CALCULATION_SYSTEM = "你是一个数学计算助手。请解决用户提出的数学问题。"
+CALCULATION_INSTRUCTION = "请计算："
+
+RELEVANCE_SYSTEM = "你是一个相关性判断助手。请判断FAQ是否与用户问题相关。"
+RELEVANCE_INSTRUCTION = "请判断下面的FAQ问题是否与用户问题相关。只回答：是 或 否"
+
+ANSWER_SYSTEM = "你是一个问答助手。请根据提供的参考信息回答用户问题。如果参考信息不足，请说明无法回答。"
+ANSWER_INSTRUCTION = "请根据下面的参考信息回答用户问题，回答要准确、完整、有条理。"
+
+
+def build_messages(system: str, instruction: str, content: str) -> list:
+    """
+    Assemble chat messages as a stable prefix (system + instruction)
+    followed by the variable content
+    """
+    return [
+        ("system", system),
+        ("human", f"{instruction}\n\n{content}"),
+    ]
+
+
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens with tiktoken, falling back to a character estimate
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning("tiktoken不可用，使用字符数估算token: %s", e)
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # 中文约1字符1token，英文约4字符1token，取折中
+    return max(1, len(text) // 2)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Truncate text to at most max_tokens tokens
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens]) + "…"
+    return text[:max_tokens * 2] + "…"
+
+
+def pack_faqs(faqs: list, token_budget: int, max_answer_tokens: int) -> tuple:
+    """
+    Pack FAQs into a context block by descending relevance score until the
+    token budget is used up. Long answers are truncated to max_answer_tokens.
+
+    Returns (context, packed_faqs)
+    """
+    ranked = sorted(faqs, key=lambda faq: faq.get("relevance_score", 0), reverse=True)
+    parts = []
+    packed = []
+    used = 0
+    for faq in ranked:
+        answer = truncate_to_tokens(faq.get("answer", ""), max_answer_tokens)
+        part = f"Q: {faq.get('question', '')}\nA: {answer}"
+        cost = count_tokens(part) + 2  # separator
+        if used + cost > token_budget:
+            if not parts:
+                # Always keep the best match, cut to whatever fits
+                parts.append(truncate_to_tokens(part, token_budget))
+                packed.append(faq)
+            break
+        parts.append(part)
+        packed.append(faq)
+        used += cost
+
+    if len(packed) < len(ranked):
+        logger.debug("上下文预算 %s tokens，保留 %s/%s 个FAQ", token_budget, len(packed), len(ranked))
+    return "\n\n".join(parts), packed
+
+
+class PromptCacheStats:
+    """
+    Accumulates DeepSeek prefix-cache hit/miss tokens across calls
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cache_hit_tokens = 0
+
+    def record(self, response) -> int:
+        """
+        Record usage from a model response and return its cache hit tokens
+        """
+        usage = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens", 0) or 0
+        hit_tokens = (usage.get("input_token_details") or {}).get("cache_read")
+        if hit_tokens is None:
+            token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+            hit_tokens = token_usage.get("prompt_cache_hit_tokens", 0)
+            prompt_tokens = prompt_tokens or token_usage.get("prompt_tokens", 0)
+        hit_tokens = hit_tokens or 0
+
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.cache_hit_tokens += hit_tokens
+        logger.debug("提示词 %s tokens，前缀缓存命中 %s tokens", prompt_tokens, hit_tokens)
+        return hit_tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hit_rate = self.cache_hit_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cache_hit_tokens": self.cache_hit_tokens,
+                "cache_hit_rate": round(hit_rate, 3),
+            }
+
+
+# 进程级的缓存统计
+prompt_cache_stats = PromptCacheStats()
@@ -1,5 +1,7 @@
 import streamlit as st
+from src.database.conversation_store import get_conversation_store
 from src.llm.qa_processor import QAProcessor
+from src.utils.config import get_chat_settings
 from src.utils.logger import get_logger
 
 
@@ -11,7 +13,7 @@ def render_chat_page():
     """
     渲染智能问答页面
     """
-    logger.info("渲染智能问答页面")
+    logger.debug("渲染智能问答页面")
     
     st.title("💬 智能问答")
     
@@ -22,7 +24,7 @@ def render_chat_page():
         st.warning("请先上传文档并构建知识库！")
         return
     
-    logger.info("向量存储已就绪，可以开始问答")
+    logger.debug("向量存储已就绪，可以开始问答")
     
     # Initialize QA processor and connect to the vector store
     if 'qa_processor' not in st.session_state:
@@ -36,20 +38,31 @@ def render_chat_page():
     
     qa_processor = st.session_state.qa_processor
     
+    # Conversation history lives in SQLite; session state only keeps a recent window
+    settings = get_chat_settings()
+    store = get_conversation_store(settings["db_path"])
+    _ensure_conversation(store, settings)
+    
+    doc_ids = _render_document_scope()
+    
+    _render_older_messages(store, settings)
+    
     # Display chat history
     chat_history_count = len(st.session_state.chat_history)
-    logger.debug(f"显示聊天历史，共 {chat_history_count} 条记录")
+    logger.debug("显示聊天历史，共 %s 条记录", chat_history_count)
     
     for msg in st.session_state.chat_history:
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
     
+    _render_answer_actions(qa_processor, store, doc_ids)
+    
     # Chat input
     if prompt := st.chat_input("请输入您的问题..."):
-        logger.info(f"用户提问: {prompt}")
+        logger.info("用户提问: %s", prompt)
         
         # Add user message to history
-        st.session_state.chat_history.append({"role": "user", "content": prompt})
+        _append_message(store, settings, "user", prompt)
         
         with st.chat_message("user"):
             st.markdown(prompt)
@@ -60,36 +73,13 @@ def render_chat_page():
             try:
                 # Get response from QA processor
                 logger.info("开始处理用户问题")
-                response = qa_processor.process_question(prompt)
+                response = qa_processor.process_question(prompt, doc_ids=doc_ids)
                 logger.info("问题处理完成")
                 
                 # Display response
                 message_placeholder.markdown(response)
                 logger.debug("助手回复已显示")
                 
-                # Add feedback buttons
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    if st.button("👍 赞同", key=f"like_{len(st.session_state.chat_history)}"):
-                        logger.info("用户点击赞同按钮")
-                        st.success("感谢您的反馈！")
-                with col2:
-                    if st.button("👎 不赞同", key=f"dislike_{len(st.session_state.chat_history)}"):
-                        logger.info("用户点击不赞同按钮")
-                        st.info("我们会持续改进！")
-                with col3:
-                    if st.button("🔄 重新生成", key=f"regenerate_{len(st.session_state.chat_history)}"):
-                        logger.info("用户点击重新生成按钮")
-                        # Remove last assistant response and regenerate
-                        if st.session_state.chat_history and st.session_state.chat_history[-1]["role"] == "assistant":
-                            st.session_state.chat_history.pop()
-                            logger.debug("移除上一次助手回复")
-                        
-                        # Regenerate response
-                        logger.info("重新生成回答")
-                        new_response = qa_processor.process_question(prompt)
-                        st.rerun()
-                
             except Exception as e:
                 error_msg = f"处理问题时发生错误: {str(e)}"
                 logger.exception(error_msg)
@@ -97,11 +87,125 @@ def render_chat_page():
                 response = "抱歉，处理问题时出现了错误。"
         
         # Add assistant response to history
-        st.session_state.chat_history.append({"role": "assistant", "content": response})
+        _append_message(store, settings, "assistant", response)
         logger.debug("助手回复已添加到聊天历史")
+        
+        # Rerun so the new answer is rendered from history together with its feedback buttons
+        st.rerun()
     else:
         logger.debug("等待用户输入问题")
 
 
+def _render_answer_actions(qa_processor, store, doc_ids: list = None):
+    """
+    Render feedback buttons for the latest assistant answer
+    """
+    history = st.session_state.chat_history
+    if len(history) < 2 or history[-1]["role"] != "assistant" or history[-2]["role"] != "user":
+        return
+    
+    answer = history[-1]
+    question = history[-2]["content"]
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("👍 赞同", key=f"like_{answer['id']}"):
+            logger.info("用户点击赞同按钮")
+            st.success("感谢您的反馈！")
+    with col2:
+        if st.button("👎 不赞同", key=f"dislike_{answer['id']}"):
+            logger.info("用户点击不赞同按钮")
+            st.info("我们会持续改进！")
+    with col3:
+        if st.button("🔄 重新生成", key=f"regenerate_{answer['id']}"):
+            logger.info("用户点击重新生成按钮")
+            # Routing, retrieval and filtering are reused; only the answer is regenerated
+            with st.spinner("正在重新生成..."):
+                new_response = qa_processor.regenerate_answer(question, doc_ids=doc_ids)
+            store.update_message(answer["id"], new_response)
+            answer["content"] = new_response
+            logger.debug("已替换上一次助手回复")
+            st.rerun()
+
+
+def _render_document_scope() -> list:
+    """
+    Let the user restrict retrieval to some of the uploaded documents
+    """
+    documents = st.session_state.vector_store.documents()
+    if len(documents) < 2:
+        return []
+    return st.multiselect(
+        "限定检索的文档（不选则检索全部文档）",
+        options=list(documents),
+        format_func=lambda content_hash: documents.get(content_hash, content_hash),
+        key="document_scope"
+    )
+
+
+def _ensure_conversation(store, settings: dict):
+    """
+    Bind the session to a persisted conversation and load its recent window.
+    The conversation id is kept in the URL so a reload or restart resumes it.
+    """
+    if 'conversation_id' in st.session_state:
+        return
+    
+    conversation_id = st.query_params.get("conversation")
+    if not conversation_id or not store.conversation_exists(conversation_id):
+        conversation_id = store.create_conversation()
+        st.query_params["conversation"] = conversation_id
+        logger.info("创建新对话: %s", conversation_id)
+    else:
+        logger.info("恢复已有对话: %s", conversation_id)
+    
+    st.session_state.conversation_id = conversation_id
+    st.session_state.chat_history = store.recent_messages(conversation_id, settings["window_size"])
+    st.session_state.older_pages = 0
+
+
+def _append_message(store, settings: dict, role: str, content: str):
+    """
+    Persist a message and keep only the most recent window in session state
+    """
+    message = store.append_message(st.session_state.conversation_id, role, content)
+    history = st.session_state.chat_history
+    history.append(message)
+    del history[:-settings["window_size"]]
+
+
+def _render_older_messages(store, settings: dict):
+    """
+    Lazily render messages that fell out of the session window, one page at a time.
+    Pages are read from SQLite on demand and never kept in session state.
+    """
+    history = st.session_state.chat_history
+    if not history:
+        return
+    
+    conversation_id = st.session_state.conversation_id
+    older_count = store.count_messages(conversation_id) - len(history)
+    if older_count <= 0:
+        return
+    
+    pages = st.session_state.get('older_pages', 0)
+    if pages:
+        older = store.messages_before(conversation_id, history[0]["id"], pages * settings["page_size"])
+        with st.expander(f"更早的消息（已加载 {len(older)}/{older_count} 条）", expanded=True):
+            for msg in older:
+                with st.chat_message(msg["role"]):
+                    st.markdown(msg["content"])
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if pages * settings["page_size"] < older_count and st.button("⬆️ 加载更早的消息"):
+            st.session_state.older_pages = pages + 1
+            st.rerun()
+    with col2:
+        if pages and st.button("收起更早的消息"):
+            st.session_state.older_pages = 0
+            st.rerun()
+
+
 if __name__ == "__main__":
     render_chat_page()
\ No newline at end of file
@@ -2,6 +2,9 @@ import streamlit as st
 from src.ui.upload_page import render_upload_page
 from src.ui.chat_page import render_chat_page
 from src.utils.logger import get_logger
+from src.utils.call_governor import get_all_governor_stats
+from src.llm.prompts import prompt_cache_stats
+from src.database.index_registry import get_index_registry
 
 
 # 设置日志
@@ -12,7 +15,7 @@ def main():
     """
     主界面函数
     """
-    logger.info("启动主界面")
+    logger.debug("启动主界面")
     
     try:
         st.set_page_config(
@@ -36,7 +39,7 @@ def main():
             st.session_state.vector_store_ready = False
             logger.debug("初始化向量存储状态")
         
-        logger.info("会话状态初始化完成")
+        logger.debug("会话状态初始化完成")
         
         # Navigation
         with st.sidebar:
@@ -49,19 +52,35 @@ def main():
                 st.session_state.current_page = 'chat'
             
             st.divider()
+            with st.expander("模型服务状态"):
+                for stats in get_all_governor_stats():
+                    st.caption(
+                        f"{stats['name']}: {stats['state']} | 并发 {stats['in_flight']}/{stats['concurrency_limit']} "
+                        f"| 排队 {stats['queue_depth']} | 速率 {stats['rate_per_second']}/秒"
+                    )
+                cache = prompt_cache_stats.snapshot()
+                st.caption(
+                    f"前缀缓存命中: {cache['cache_hit_tokens']}/{cache['prompt_tokens']} tokens "
+                    f"({cache['cache_hit_rate']:.0%})"
+                )
+                indexes = get_index_registry().stats()
+                st.caption(
+                    f"共享索引: {indexes['indexes']} 个（使用中 {indexes['referenced']}）| "
+                    f"向量 {indexes['vectors']}/{indexes['max_vectors']}"
+                )
             st.info("智能文档问答系统 v0.1")
         
-        logger.debug(f"当前页面: {st.session_state.current_page}")
+        logger.debug("当前页面: %s", st.session_state.current_page)
         
         # Page routing
         if st.session_state.current_page == 'upload':
-            logger.info("渲染文档上传页面")
+            logger.debug("渲染文档上传页面")
             render_upload_page()
         elif st.session_state.current_page == 'chat':
-            logger.info("渲染问答页面")
+            logger.debug("渲染问答页面")
             render_chat_page()
         else:
-            logger.warning(f"未知页面: {st.session_state.current_page}")
+            logger.warning("未知页面: %s", st.session_state.current_page)
             st.error("页面配置错误")
             
         logger.debug("页面渲染完成")
@@ -1,34 +1,50 @@
 import streamlit as st
+import hashlib
 import os
 from pathlib import Path
 import tempfile
-from src.data.parser import DocumentParser
+from src.data.parser import DocumentParser, page_of
 from src.llm.faq_extractor import FAQExtractor
-from src.database.vector_store import VectorStoreManager
+from src.database.index_registry import SessionKnowledgeBase, get_index_registry
+from src.database.vector_store import SnapshotError
+from src.utils.config import get_snapshot_dir
 from src.utils.logger import get_logger
 
 
 # 设置日志
 logger = get_logger("ui.upload_page")
 
+# 流式提取时每攒够这么多FAQ就写入一次向量库
+EMBED_BATCH_SIZE = 8
+
+
+class _NoFAQsExtracted(Exception):
+    """
+    Raised by the index builder so an empty index is not kept in the shared registry
+    """
+
 
 def render_upload_page():
     """
     渲染文档上传页面
     """
-    logger.info("渲染文档上传页面")
+    logger.debug("渲染文档上传页面")
     
     st.title("📚 文档上传")
     
+    _render_document_list()
+    
     # File uploader
     uploaded_file = st.file_uploader(
         "选择要上传的文档",
         type=['pdf', 'txt'],
-        accept_multiple_files=False
+        accept_multiple_files=False,
+        # Changing the key clears the uploader after a document is removed
+        key=f"uploader_{st.session_state.get('uploader_generation', 0)}"
     )
     
     if uploaded_file is not None:
-        logger.info(f"用户上传文件: {uploaded_file.name}")
+        logger.debug("用户上传文件: %s", uploaded_file.name)
         
         # Validate file type
         file_ext = uploaded_file.name.split('.')[-1].lower()
@@ -38,88 +54,276 @@ def render_upload_page():
             st.error(f"{error_msg}. 仅支持 PDF 和 TXT 文件。")
             return
         
-        logger.info(f"文件格式验证通过: {file_ext}")
+        logger.debug("文件格式验证通过: %s", file_ext)
         st.success(f"已选择文件: {uploaded_file.name}")
         
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_ext}") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            temp_path = tmp_file.name
+        content = uploaded_file.getvalue()
+        content_hash = hashlib.sha256(content).hexdigest()
         
-        logger.debug(f"临时文件保存路径: {temp_path}")
+        # The session's knowledge base is a view over shared per-document indexes
+        if 'vector_store' not in st.session_state:
+            st.session_state.vector_store = SessionKnowledgeBase()
+            logger.debug("初始化会话知识库")
+        knowledge_base = st.session_state.vector_store
         
-        try:
-            # Parse document
-            parser = DocumentParser()
-            st.info("正在解析文档...")
-            logger.info("开始解析文档")
-            
-            if file_ext == 'pdf':
-                logger.debug("解析PDF文档")
-                text_content = parser.parse_pdf(temp_path)
-            else:  # txt
-                logger.debug("解析TXT文档")
-                text_content = parser.parse_txt(temp_path)
-            
-            logger.info(f"文档解析完成，内容长度: {len(text_content)} 字符")
-            st.success("文档解析完成！")
-            
-            # Extract FAQs
-            st.info("正在提取FAQ...")
-            logger.info("开始提取FAQ")
-            
-            faq_extractor = FAQExtractor()
-            faqs = faq_extractor.extract_faqs(text_content)
-            
-            logger.info(f"FAQ提取完成，提取到 {len(faqs)} 个FAQ对")
-            
-            if faqs:
-                st.success(f"成功提取 {len(faqs)} 个FAQ对！")
-                
-                # Store FAQs in vector database
-                st.info("正在构建知识库...")
-                logger.info("开始构建向量知识库")
-                
-                # Create and store vector store in session state
-                if 'vector_store' not in st.session_state:
-                    st.session_state.vector_store = VectorStoreManager()
-                    logger.debug("初始化向量存储管理器")
-                
-                st.session_state.vector_store.add_faqs(faqs)
-                logger.info("FAQ对已添加到向量存储")
-                
-                st.session_state.vector_store_ready = True
-                st.success("知识库构建完成！")
-                logger.info("知识库构建完成，向量存储已就绪")
-                
-                # Show sample FAQs
-                st.subheader("提取的FAQ样本:")
-                for i, faq in enumerate(faqs[:3]):  # Show first 3
-                    with st.expander(f"FAQ {i+1}"):
-                        st.write(f"**问题:** {faq['问题']}")
-                        st.write(f"**答案:** {faq['答案']}")
-                logger.debug("显示FAQ样本")
-            else:
-                warning_msg = "未能从文档中提取到任何FAQ对"
-                logger.warning(warning_msg)
-                st.warning(f"{warning_msg}，请检查文档内容。")
+        if knowledge_base.has_document(content_hash):
+            # Streamlit reruns this page on every interaction; don't reprocess the same file
+            logger.debug("文档已在当前知识库中，跳过处理")
+            st.info("该文档已在知识库中，可以开始问答。")
+            return
+        
+        # A different file with the same name is treated as a revision of that document
+        previous_hash = knowledge_base.find_document(uploaded_file.name)
+        base_store = knowledge_base.get_vector_store(previous_hash) if previous_hash else None
+        
+        extracted_faqs = []
+        diff_report = {}
+        
+        def build_index(vector_store):
+            # Another replica may already have ingested this document
+            if _load_snapshot(content_hash, vector_store):
+                return
+            _build_document_index(
+                content, file_ext, content_hash, vector_store, extracted_faqs, base_store, diff_report
+            )
+            if not vector_store.doc_counter:
+                raise _NoFAQsExtracted()
+            # Only reached when every window was extracted: _build_document_index raises
+            # on failed windows, so a partial knowledge base is never persisted
+            _save_snapshot(content_hash, vector_store)
         
+        try:
+            with st.spinner("正在构建知识库..."):
+                # A failed build raises out of acquire, which drops the entry so the next upload retries
+                lease = get_index_registry().acquire(content_hash, build_index)
+        except _NoFAQsExtracted:
+            _warn_no_faqs()
+            return
         except Exception as e:
             error_msg = f"处理文档时发生错误: {str(e)}"
             logger.exception(error_msg)
             st.error(error_msg)
+            return
         
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                    logger.debug("临时文件已清理")
-                except Exception as e:
-                    logger.warning(f"清理临时文件失败: {e}")
+        faq_count = lease.vector_store.doc_counter
+        if not faq_count:
+            # Never register an empty document: re-uploading it must extract again
+            lease.release()
+            _warn_no_faqs()
+            return
+        
+        if previous_hash:
+            knowledge_base.remove_document(previous_hash)
+            logger.info("文档 %s 已更新为新版本", uploaded_file.name)
+        knowledge_base.add_document(lease, uploaded_file.name)
+        
+        if diff_report:
+            _render_diff_report(diff_report)
+        
+        if not lease.created:
+            logger.info("复用其他会话已构建的相同文档索引")
+            st.info("检测到相同文档，已复用现有知识库索引。")
+        st.success(f"知识库构建完成！共 {faq_count} 个FAQ对。")
+        st.session_state.vector_store_ready = True
+        logger.info("知识库构建完成，向量存储已就绪")
+        
+        if extracted_faqs:
+            # Show sample FAQs
+            st.subheader("提取的FAQ样本:")
+            for i, faq in enumerate(extracted_faqs[:3]):  # Show first 3
+                with st.expander(f"FAQ {i+1}"):
+                    st.write(f"**问题:** {faq['问题']}")
+                    st.write(f"**答案:** {faq['答案']}")
+            logger.debug("显示FAQ样本")
     else:
         logger.debug("等待用户上传文件")
 
 
+def _build_document_index(content: bytes, file_ext: str, doc_id: str, vector_store, extracted_faqs: list,
+                          base_store=None, diff_report: dict = None):
+    """
+    Parse a document, extract its FAQs and add them to a fresh vector store.
+    When base_store holds an earlier revision of the document, FAQs of unchanged
+    windows are copied over and only the changed windows are sent to the LLM.
+    """
+    # Save uploaded file temporarily
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_ext}") as tmp_file:
+        tmp_file.write(content)
+        temp_path = tmp_file.name
+    
+    logger.debug("临时文件保存路径: %s", temp_path)
+    
+    try:
+        # Parse document
+        parser = DocumentParser()
+        st.info("正在解析文档...")
+        logger.info("开始解析文档")
+        
+        if file_ext == 'pdf':
+            logger.debug("解析PDF文档")
+            text_content = parser.parse_pdf(temp_path)
+        else:  # txt
+            logger.debug("解析TXT文档")
+            text_content = parser.parse_txt(temp_path)
+        
+        logger.info("文档解析完成，内容长度: %s 字符", len(text_content))
+        st.success("文档解析完成！")
+        cleanup = parser.cleanup_stats
+        if cleanup["removed_chars"]:
+            logger.info("清理页眉页脚等重复内容: %s", cleanup)
+            st.caption(f"已清理 {cleanup['removed_lines']} 行页眉页脚/页码，共移除 {cleanup['removed_chars']} 个字符")
+        
+        # Extract FAQs
+        st.info("正在提取FAQ并构建知识库...")
+        logger.info("开始流式提取FAQ")
+        
+        faq_extractor = FAQExtractor()
+        windows = faq_extractor.plan_windows(text_content)
+        vector_store.source_window_hashes = {window["hash"] for window in windows}
+        
+        unchanged_windows = set()
+        copied_questions = []
+        if base_store is not None:
+            unchanged_windows = vector_store.source_window_hashes & base_store.source_window_hashes
+            # Unchanged windows may have moved: re-tag copies with this revision's id and offsets
+            window_metadata = {
+                window["hash"]: {
+                    "doc_id": doc_id,
+                    "page": page_of(parser.page_starts, window["start"]),
+                    "window_start": window["start"],
+                    "window_end": window["end"],
+                }
+                for window in windows if window["hash"] in unchanged_windows
+            }
+            copied = vector_store.copy_windows_from(base_store, window_metadata)
+            logger.info("复用上一版本中 %s 个未变化窗口的 %s 个FAQ对", len(unchanged_windows), copied)
+            # Changed windows overlap the unchanged chunks before them: don't add those FAQs twice
+            copied_questions = vector_store.questions()
+        
+        # FAQs are embedded in small batches while the model is still generating
+        progress = st.empty()
+        pending = []
+        faqs = faq_extractor.stream_faqs(
+            text_content, skip_window_hashes=unchanged_windows, seen_questions=copied_questions
+        )
+        for faq in faqs:
+            faq["page"] = page_of(parser.page_starts, faq["window_start"])
+            extracted_faqs.append(faq)
+            pending.append(faq)
+            if len(pending) >= EMBED_BATCH_SIZE:
+                vector_store.add_faqs(pending, doc_id=doc_id)
+                pending = []
+            progress.text(f"已提取 {len(extracted_faqs)} 个FAQ对...")
+        if pending:
+            vector_store.add_faqs(pending, doc_id=doc_id)
+        
+        failed_windows = faq_extractor.extraction_report()["failed_windows"]
+        if failed_windows:
+            raise RuntimeError(f"{failed_windows} 个窗口的FAQ提取失败，请稍后重新上传")
+        
+        if base_store is not None and diff_report is not None:
+            removed_windows = base_store.source_window_hashes - vector_store.source_window_hashes
+            base_counts = base_store.window_hashes()
+            diff_report.update({
+                "unchanged_windows": len(unchanged_windows),
+                "added_windows": len(vector_store.source_window_hashes - unchanged_windows),
+                "removed_windows": len(removed_windows),
+                "added_faqs": len(extracted_faqs),
+                "removed_faqs": sum(base_counts.get(window_hash, 0) for window_hash in removed_windows),
+            })
+            logger.info("文档增量更新: %s", diff_report)
+        
+        report = faq_extractor.extraction_report()
+        if report["windows"] or report["skipped_windows"]:
+            st.caption(
+                f"模型输出 {report['output_tokens']} tokens（服务商计费 {report['provider_output_tokens']}），"
+                f"较冗长格式约节省 {report['tokens_saved']} tokens，"
+                f"解析失败率 {report['parse_failure_rate']:.1%}，"
+                f"预过滤跳过 {report['skipped_windows']} 个低信息密度窗口"
+            )
+        logger.info("FAQ提取完成，提取到 %s 个FAQ对", len(extracted_faqs))
+    
+    finally:
+        # Clean up temporary file
+        if os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+                logger.debug("临时文件已清理")
+            except Exception as e:
+                logger.warning("清理临时文件失败: %s", e)
+
+
+def _warn_no_faqs():
+    warning_msg = "未能从文档中提取到任何FAQ对"
+    logger.warning(warning_msg)
+    st.warning(f"{warning_msg}，请检查文档内容。")
+
+
+def _snapshot_path(content_hash: str):
+    snapshot_dir = get_snapshot_dir()
+    return os.path.join(snapshot_dir, f"{content_hash}.tdqa") if snapshot_dir else None
+
+
+def _load_snapshot(content_hash: str, vector_store) -> bool:
+    """
+    Fill the vector store from a saved snapshot of the document, if one exists
+    """
+    snapshot_path = _snapshot_path(content_hash)
+    if not snapshot_path or not os.path.exists(snapshot_path):
+        return False
+    try:
+        vector_store.import_snapshot(snapshot_path)
+    except (SnapshotError, OSError, ValueError) as e:
+        logger.warning("加载知识库快照失败，改为重新提取: %s", e)
+        return False
+    st.info("已从知识库快照加载，无需重新提取。")
+    return True
+
+
+def _save_snapshot(content_hash: str, vector_store):
+    snapshot_path = _snapshot_path(content_hash)
+    if not snapshot_path or not vector_store.doc_counter:
+        return
+    try:
+        vector_store.export_snapshot(snapshot_path)
+    except OSError as e:
+        logger.warning("保存知识库快照失败: %s", e)
+
+
+def _render_document_list():
+    """
+    List the documents in the session's knowledge base with a remove button each
+    """
+    knowledge_base = st.session_state.get('vector_store')
+    if knowledge_base is None or not knowledge_base.documents():
+        return
+    
+    st.subheader("知识库中的文档")
+    for content_hash, name in knowledge_base.documents().items():
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.write(f"📄 {name}")
+        with col2:
+            if st.button("删除", key=f"remove_{content_hash}"):
+                # Drops all of the document's FAQs from this session at once
+                knowledge_base.remove_document(content_hash)
+                logger.info("从知识库移除文档: %s", name)
+                st.session_state.uploader_generation = st.session_state.get('uploader_generation', 0) + 1
+                if not knowledge_base.documents():
+                    st.session_state.vector_store_ready = False
+                st.rerun()
+
+
+def _render_diff_report(diff_report: dict):
+    """
+    Show what changed between two revisions of a document
+    """
+    st.info(
+        f"检测到文档新版本：{diff_report['unchanged_windows']} 个窗口未变化，"
+        f"重新提取 {diff_report['added_windows']} 个窗口，移除 {diff_report['removed_windows']} 个窗口。"
+    )
+    st.write(f"新增FAQ: {diff_report['added_faqs']} 个，移除FAQ: {diff_report['removed_faqs']} 个")
+
+
 if __name__ == "__main__":
     render_upload_page()
\ No newline at end of file
@@ -0,0 +1,412 @@
+import asyncio
+import random
+import threading
+import time
+from .config import get_governor_settings
+from .logger import get_logger
+
+
+# 设置日志
+logger = get_logger("utils.call_governor")
+
+# 异步调用等待并发槽位时的轮询间隔（秒）
+_ASYNC_SLOT_POLL = 0.02
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when a call is rejected because the provider's circuit is open
+    """
+
+
+class CallGovernor:
+    """
+    Client-side governor for calls to a remote model provider.
+
+    Combines a token bucket (request rate), an AIMD concurrency limit driven
+    by 429 and latency signals, exponential backoff with full jitter, and a
+    circuit breaker. One instance is shared by every caller of a provider.
+    """
+
+    def __init__(self, name: str, rate_per_second: float = 5.0, burst: int = 10,
+                 max_concurrency: int = 8, min_concurrency: int = 1,
+                 max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 30.0,
+                 latency_target: float = 30.0, failure_threshold: int = 5,
+                 recovery_timeout: float = 30.0):
+        self.name = name
+        self.max_rate = rate_per_second
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.latency_target = latency_target
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self._lock = threading.Lock()
+        self._slot_available = threading.Condition(self._lock)
+
+        # Token bucket
+        self._rate = rate_per_second
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+
+        # AIMD concurrency
+        self._limit = float(max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+
+        # Circuit breaker
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_trial = False
+
+        # Counters
+        self._calls = 0
+        self._retries = 0
+        self._throttled = 0
+        self._failures = 0
+        self._rejected = 0
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) under rate, concurrency and retry control
+        """
+        attempt = 0
+        while True:
+            self._before_call()
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            finally:
+                self._release_slot()
+
+            if error is not None:
+                attempt = self._handle_failure(error, attempt)
+                continue
+            self._record_success(time.monotonic() - started)
+            return result
+
+    def stream(self, func, *args, **kwargs):
+        """
+        Iterate over func(*args, **kwargs) under governor control.
+
+        Failures before the first chunk are retried; once output has started
+        the error is raised, since a partial stream cannot be replayed.
+        """
+        attempt = 0
+        while True:
+            self._before_call()
+            started = time.monotonic()
+            first_chunk = True
+            error = None
+            try:
+                for chunk in func(*args, **kwargs):
+                    if first_chunk:
+                        # Time to first chunk is the latency signal for AIMD
+                        self._record_success(time.monotonic() - started)
+                        first_chunk = False
+                    yield chunk
+            except Exception as e:
+                error = e
+            finally:
+                # Also runs when the consumer abandons the stream early
+                self._release_slot()
+
+            if error is None:
+                if first_chunk:
+                    self._record_success(time.monotonic() - started)
+                return
+            if not first_chunk:
+                self._record_failure(retryable=_is_retryable(error), throttled=_is_throttled(error))
+                raise error
+            attempt = self._handle_failure(error, attempt)
+
+    async def acall(self, func, *args, **kwargs):
+        """
+        Await func(*args, **kwargs) under the same control as call(),
+        without blocking the event loop while waiting
+        """
+        attempt = 0
+        while True:
+            await self._abefore_call()
+            started = time.monotonic()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            finally:
+                self._release_slot()
+
+            if error is not None:
+                attempt = await self._ahandle_failure(error, attempt)
+                continue
+            self._record_success(time.monotonic() - started)
+            return result
+
+    async def astream(self, func, *args, **kwargs):
+        """
+        Async counterpart of stream() for async iterators such as llm.astream
+        """
+        attempt = 0
+        while True:
+            await self._abefore_call()
+            started = time.monotonic()
+            first_chunk = True
+            error = None
+            try:
+                async for chunk in func(*args, **kwargs):
+                    if first_chunk:
+                        self._record_success(time.monotonic() - started)
+                        first_chunk = False
+                    yield chunk
+            except Exception as e:
+                error = e
+            finally:
+                self._release_slot()
+
+            if error is None:
+                if first_chunk:
+                    self._record_success(time.monotonic() - started)
+                return
+            if not first_chunk:
+                self._record_failure(retryable=_is_retryable(error), throttled=_is_throttled(error))
+                raise error
+            attempt = await self._ahandle_failure(error, attempt)
+
+    def stats(self) -> dict:
+        """
+        Current limits, queue depth and counters
+        """
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._state,
+                "rate_per_second": round(self._rate, 3),
+                "concurrency_limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "queue_depth": self._waiting,
+                "calls": self._calls,
+                "retries": self._retries,
+                "throttled": self._throttled,
+                "failures": self._failures,
+                "rejected": self._rejected,
+            }
+
+    def _before_call(self):
+        """
+        Check the circuit, then wait for a rate token and a concurrency slot
+        """
+        self._check_circuit()
+        self._acquire_token()
+        with self._slot_available:
+            self._waiting += 1
+            try:
+                while self._in_flight >= int(self._limit):
+                    self._slot_available.wait()
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+            self._calls += 1
+
+    async def _abefore_call(self):
+        self._check_circuit()
+        while (wait := self._take_token()) > 0:
+            await asyncio.sleep(wait)
+        with self._lock:
+            self._waiting += 1
+        try:
+            while not self._try_take_slot():
+                await asyncio.sleep(_ASYNC_SLOT_POLL)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def _try_take_slot(self) -> bool:
+        with self._lock:
+            if self._in_flight >= int(self._limit):
+                return False
+            self._in_flight += 1
+            self._calls += 1
+            return True
+
+    def _release_slot(self):
+        with self._slot_available:
+            self._in_flight -= 1
+            self._slot_available.notify()
+
+    def _acquire_token(self):
+        while (wait := self._take_token()) > 0:
+            time.sleep(wait)
+
+    def _take_token(self) -> float:
+        """
+        Take a rate token, or return the seconds to wait before one is available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self._rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self._rate
+
+    def _check_circuit(self):
+        with self._lock:
+            if self._state == "closed":
+                return
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self._state = "half_open"
+                self._half_open_trial = False
+                logger.info("[%s] 熔断器进入半开状态", self.name)
+            if self._state == "half_open" and not self._half_open_trial:
+                # Let exactly one trial call through
+                self._half_open_trial = True
+                return
+            self._rejected += 1
+        raise CircuitOpenError(f"{self.name} 服务熔断中，请稍后重试")
+
+    def _handle_failure(self, error: Exception, attempt: int) -> int:
+        """
+        Record a failed attempt and sleep before the next one, or re-raise
+        """
+        time.sleep(self._retry_delay(error, attempt))
+        return attempt + 1
+
+    async def _ahandle_failure(self, error: Exception, attempt: int) -> int:
+        await asyncio.sleep(self._retry_delay(error, attempt))
+        return attempt + 1
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """
+        Record a failed attempt and return the backoff before retrying, or re-raise
+        """
+        retryable = _is_retryable(error)
+        self._record_failure(retryable, throttled=_is_throttled(error))
+        if not retryable or attempt >= self.max_retries or self._state == "open":
+            raise error
+
+        delay = _retry_after(error)
+        if delay is None:
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        with self._lock:
+            self._retries += 1
+        logger.warning("[%s] 调用失败，%.2f秒后进行第 %s 次重试: %s", self.name, delay, attempt + 1, error)
+        return delay
+
+    def _record_success(self, latency: float):
+        with self._slot_available:
+            if self._state != "closed":
+                logger.info("[%s] 熔断器恢复关闭", self.name)
+            self._state = "closed"
+            self._consecutive_failures = 0
+
+            if latency > self.latency_target:
+                # Slow responses mean the provider is saturating: back off gently
+                self._limit = max(self.min_concurrency, self._limit * 0.9)
+            else:
+                self._limit = min(self.max_concurrency, self._limit + 1 / max(self._limit, 1))
+                self._rate = min(self.max_rate, self._rate + self.max_rate * 0.05)
+            self._slot_available.notify_all()
+
+    def _record_failure(self, retryable: bool, throttled: bool = False):
+        with self._lock:
+            if throttled:
+                # Multiplicative decrease on explicit throttling
+                self._throttled += 1
+                self._limit = max(self.min_concurrency, self._limit / 2)
+                self._rate = max(self.max_rate * 0.05, self._rate / 2)
+                logger.info("[%s] 触发限流，并发上限降至 %s，速率降至 %.2f/秒", self.name, int(self._limit), self._rate)
+            if throttled or not retryable:
+                # Throttling means the provider is up and only asks us to slow down:
+                # back off, but don't count it toward opening the circuit
+                if self._state == "half_open":
+                    # The trial call proved nothing about availability; allow another
+                    self._half_open_trial = False
+                return
+            self._failures += 1
+            self._consecutive_failures += 1
+            if self._state == "half_open" or self._consecutive_failures >= self.failure_threshold:
+                if self._state != "open":
+                    logger.error("[%s] 连续失败 %s 次，熔断器打开", self.name, self._consecutive_failures)
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+
+def _status_code(error: Exception):
+    """
+    Best-effort HTTP status code of a provider error
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_throttled(error: Exception) -> bool:
+    if _status_code(error) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "throttl" in message
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status == 408 or status >= 500
+    if _is_throttled(error):
+        return True
+    name = type(error).__name__.lower()
+    return "timeout" in name or "connection" in name
+
+
+def _retry_after(error: Exception):
+    """
+    Seconds requested by a Retry-After header, if any
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(name: str) -> CallGovernor:
+    """
+    Get the process-wide governor for a provider ("deepseek" or "dashscope")
+    """
+    with _governors_lock:
+        if name not in _governors:
+            settings = get_governor_settings(name)
+            _governors[name] = CallGovernor(name, **settings)
+            logger.info("初始化调用控制器 %s: %s", name, settings)
+        return _governors[name]
+
+
+def get_all_governor_stats() -> list:
+    """
+    Stats of every governor created so far
+    """
+    with _governors_lock:
+        governors = list(_governors.values())
+    return [governor.stats() for governor in governors]
@@ -11,18 +11,18 @@ def load_env_vars():
     """
     Load environment variables from .env file
     """
-    logger.info("开始加载环境变量")
+    logger.debug("开始加载环境变量")
     
     # 检查.env文件是否存在
     env_file = ".env"
     if os.path.exists(env_file):
-        logger.info(f"找到环境变量文件: {env_file}")
+        logger.debug("找到环境变量文件: %s", env_file)
     else:
-        logger.warning(f"未找到环境变量文件: {env_file}，将使用系统环境变量")
+        logger.warning("未找到环境变量文件: %s，将使用系统环境变量", env_file)
     
     # 加载环境变量
     load_dotenv()
-    logger.info("环境变量加载完成")
+    logger.debug("环境变量加载完成")
     
     # 确保必需的环境变量已设置
     required_vars = ['DEEPSEEK_API_KEY']
@@ -37,9 +37,9 @@ def load_env_vars():
     for var in required_vars:
         if os.getenv(var):
             # 只记录变量名，不记录实际值
-            logger.info(f"环境变量 {var} 已设置")
+            logger.debug("环境变量 %s 已设置", var)
     
-    logger.info("环境变量验证完成")
+    logger.debug("环境变量验证完成")
     return True
 
 
@@ -55,4 +55,102 @@ def get_api_key():
         return api_key
     else:
         logger.warning("未找到DeepSeek API密钥")
-        return None
\ No newline at end of file
+        return None
+
+
+# 各模型服务的调用控制默认值
+GOVERNOR_DEFAULTS = {
+    "deepseek": {"rate_per_second": 5.0, "burst": 10, "max_concurrency": 8},
+    "dashscope": {"rate_per_second": 10.0, "burst": 10, "max_concurrency": 4},
+}
+
+
+def get_governor_settings(name: str) -> dict:
+    """
+    Get call governor settings for a provider, overridable via environment
+    (e.g. DEEPSEEK_RATE_LIMIT, DEEPSEEK_MAX_CONCURRENCY)
+    """
+    settings = dict(GOVERNOR_DEFAULTS.get(name, {}))
+    prefix = name.upper()
+    
+    rate = os.getenv(f"{prefix}_RATE_LIMIT")
+    if rate:
+        settings["rate_per_second"] = float(rate)
+    concurrency = os.getenv(f"{prefix}_MAX_CONCURRENCY")
+    if concurrency:
+        settings["max_concurrency"] = int(concurrency)
+    
+    logger.debug("%s 调用控制配置: %s", name, settings)
+    return settings
+
+
+def get_context_settings() -> dict:
+    """
+    Get the token budget for packing retrieved FAQs into the answer prompt
+    (CONTEXT_TOKEN_BUDGET, CONTEXT_MAX_ANSWER_TOKENS)
+    """
+    return {
+        "token_budget": int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+        "max_answer_tokens": int(os.getenv("CONTEXT_MAX_ANSWER_TOKENS", "600")),
+    }
+
+
+def get_chat_settings() -> dict:
+    """
+    Get chat history persistence settings (CHAT_DB_PATH, CHAT_HISTORY_WINDOW, CHAT_HISTORY_PAGE_SIZE)
+    """
+    return {
+        "db_path": os.getenv("CHAT_DB_PATH", os.path.join("data", "chat_history.db")),
+        "window_size": int(os.getenv("CHAT_HISTORY_WINDOW", "20")),
+        "page_size": int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "20")),
+    }
+
+
+def get_index_registry_settings() -> dict:
+    """
+    Get shared index lifecycle settings (INDEX_IDLE_TTL seconds, INDEX_MAX_VECTORS high-water mark)
+    """
+    return {
+        "idle_ttl": float(os.getenv("INDEX_IDLE_TTL", "1800")),
+        "max_vectors": int(os.getenv("INDEX_MAX_VECTORS", "200000")),
+    }
+
+
+def is_speculative_retrieval_enabled() -> bool:
+    """
+    Whether retrieval starts in parallel with question routing (SPECULATIVE_RETRIEVAL)
+    """
+    return os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() in ("1", "true", "yes", "on")
+
+
+def get_snapshot_dir():
+    """
+    Directory of knowledge-base snapshots shared between replicas (KB_SNAPSHOT_DIR).
+    Set it to an empty string to disable snapshots.
+    """
+    snapshot_dir = os.getenv("KB_SNAPSHOT_DIR", os.path.join("data", "snapshots"))
+    return snapshot_dir or None
+
+
+# FAQ提取的输出格式：compact 为JSON模式+短键名，verbose 为原始的中文键名JSON列表
+EXTRACTION_MODES = ("compact", "verbose")
+
+
+def get_extraction_mode() -> str:
+    """
+    Get the FAQ extraction output format (FAQ_EXTRACTION_MODE: compact or verbose)
+    """
+    mode = os.getenv("FAQ_EXTRACTION_MODE", "compact").lower()
+    if mode not in EXTRACTION_MODES:
+        logger.warning("未知的FAQ提取模式 %s，使用 compact", mode)
+        return "compact"
+    return mode
+
+
+def get_prefilter_threshold() -> float:
+    """
+    Minimum information density (0-1) a window needs to be sent for FAQ
+    extraction (FAQ_PREFILTER_THRESHOLD). Off (0) by default; 0.3 skips
+    tables of contents, reference lists and numeric tables.
+    """
+    return float(os.getenv("FAQ_PREFILTER_THRESHOLD", "0"))
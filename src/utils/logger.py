@@ -0,0 +1,153 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+
+
+# 所有模块日志都挂在这个根日志器下
+ROOT_LOGGER_NAME = "traedocqa"
+
+# LogRecord的标准属性，其余属性视为结构化的extra字段
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line.
+    Values passed via `extra=` are included as top-level fields.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+                    + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of records below WARNING for selected loggers.
+    Rates are keyed by logger name without the root prefix, e.g.
+    {"ui": 0.1, "llm.faq_extractor": 0.5}; the longest matching prefix wins.
+    """
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name[len(ROOT_LOGGER_NAME) + 1:]
+        rate = None
+        matched = -1
+        for prefix, prefix_rate in self.rates.items():
+            if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > matched:
+                rate = prefix_rate
+                matched = len(prefix)
+        return rate is None or random.random() < rate
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that enqueues the record untouched, so message
+    formatting happens on the listener thread instead of the caller's
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _parse_sample_rates(spec: str) -> dict:
+    """
+    Parse "ui=0.1,llm.faq_extractor=0.5" into a rate mapping
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def setup_logging(level: str = None, log_dir: str = None):
+    """
+    Configure application logging once per process.
+
+    Records are put on an in-memory queue by the calling thread and written
+    by a background QueueListener to the console and to a size-rotated
+    JSON-lines file. Settings come from LOG_LEVEL, LOG_DIR, LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT and LOG_SAMPLE_RATES.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+        log_dir = log_dir or os.getenv("LOG_DIR", "logs")
+        os.makedirs(log_dir, exist_ok=True)
+
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(log_dir, "app.log"),
+            maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+            backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+            encoding="utf-8",
+        )
+        file_handler.setFormatter(JsonFormatter())
+
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        ))
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(_parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))))
+
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.setLevel(level)
+        root.handlers = [queue_handler]
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """
+    Flush queued records and stop the background writer
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Get a module logger under the application root logger
+    """
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import pytest
+from langchain_core.messages import AIMessageChunk
+from src.api import server as server_module
+from src.api.server import QAServer
+from src.utils.call_governor import CircuitOpenError
+from tests.test_qa_processor import FakeChatModel, FakeKnowledgeBase, make_processor
+
+
+async def _request(port, method, path, body=None, raw_body=None, headers=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = raw_body if raw_body is not None else (json.dumps(body).encode("utf-8") if body is not None else b"")
+    head = f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(data)}\r\n"
+    for name, value in (headers or {}).items():
+        head += f"{name}: {value}\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status_line, _, rest = response.partition(b"\r\n")
+    response_headers, _, payload = rest.partition(b"\r\n\r\n")
+    return int(status_line.split()[1]), response_headers.decode("latin-1"), payload.decode("utf-8")
+
+
+def _run(processor, *requests):
+    async def main():
+        server = await QAServer(processor).start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return [await _request(port, *request[:2], **request[2]) for request in requests]
+        finally:
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def processor():
+    return make_processor(FakeChatModel(), FakeKnowledgeBase())
+
+
+def test_ask_json(processor):
+    [(status, headers, payload)] = _run(processor, ("POST", "/ask", {"body": {"question": "答案是什么？", "doc_ids": ["d1"]}}))
+    assert status == 200
+    assert "application/json" in headers
+    assert json.loads(payload) == {"answer": "根据参考信息，答案是42。"}
+
+
+def test_ask_sse(processor):
+    [(status, headers, payload)] = _run(processor, ("POST", "/ask", {"body": {"question": "答案是什么？", "stream": True}}))
+    assert status == 200
+    assert "text/event-stream" in headers
+
+    events = [event for event in payload.split("\n\n") if event]
+    deltas = [json.loads(event[len("data: "):])["delta"] for event in events[:-1]]
+    assert "".join(deltas) == "根据参考信息，答案是42。"
+    assert events[-1] == "event: done\ndata: {}"
+
+
+def test_health(processor):
+    [(status, _, payload)] = _run(processor, ("GET", "/health", {}))
+    health = json.loads(payload)
+    assert status == 200
+    assert health["status"] == "ok"
+    assert health["documents"] == 1
+    assert "governors" in health and "speculation" in health
+
+
+def test_error_responses(processor, monkeypatch):
+    monkeypatch.setattr(server_module, "MAX_BODY_BYTES", 64)
+    responses = _run(
+        processor,
+        ("POST", "/ask", {"raw_body": b"{not json"}),
+        ("POST", "/ask", {"body": {"doc_ids": ["d1"]}}),
+        ("POST", "/ask", {"body": {"question": "答案？", "doc_ids": "d1"}}),
+        ("GET", "/missing", {}),
+        ("GET", "/ask", {}),
+        ("POST", "/health", {}),
+        ("POST", "/ask", {"body": {"question": "长" * 100}}),
+    )
+    assert [status for status, _, _ in responses] == [400, 400, 400, 404, 405, 405, 413]
+    for _, _, payload in responses:
+        assert "error" in json.loads(payload)
+
+
+def _failing(error):
+    async def fail():
+        raise error
+    return fail
+
+
+class BrokenStreamModel(FakeChatModel):
+    async def astream(self, messages, **kwargs):
+        yield AIMessageChunk(content="根据")
+        raise RuntimeError("连接中断")
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_open_circuit_is_503_with_retry_after(stream):
+    llm = FakeChatModel()
+    llm.before_reply = _failing(CircuitOpenError("test 服务熔断中"))
+    processor = make_processor(llm, FakeKnowledgeBase())
+    [(status, headers, payload)] = _run(processor, ("POST", "/ask", {"body": {"question": "答案？", "stream": stream}}))
+    assert status == 503
+    assert f"Retry-After: {int(processor.governor.recovery_timeout)}" in headers
+    assert "application/json" in headers
+    assert "answer" not in json.loads(payload)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_pipeline_failure_is_500(stream):
+    llm = FakeChatModel()
+    llm.before_reply = _failing(RuntimeError("模型返回异常"))
+    processor = make_processor(llm, FakeKnowledgeBase())
+    [(status, headers, payload)] = _run(processor, ("POST", "/ask", {"body": {"question": "答案？", "stream": stream}}))
+    assert status == 500
+    assert "application/json" in headers
+    assert set(json.loads(payload)) == {"error"}
+
+
+def test_stream_failing_midway_ends_with_error_event():
+    processor = make_processor(BrokenStreamModel(), FakeKnowledgeBase())
+    [(status, _, payload)] = _run(processor, ("POST", "/ask", {"body": {"question": "答案是什么？", "stream": True}}))
+    assert status == 200
+
+    events = [event for event in payload.split("\n\n") if event]
+    assert events[0] == 'data: {"delta": "根据"}'
+    assert events[-1].startswith("event: error\ndata: ")
+    assert "error" in json.loads(events[-1].split("data: ", 1)[1])
+    assert not any(event.startswith("event: done") for event in events)
@@ -0,0 +1,127 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from src.llm import faq_extractor, qa_processor
+from src.utils.call_governor import CallGovernor, CircuitOpenError
+
+
+class _HTTPError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _governor(**overrides):
+    settings = dict(rate_per_second=1000, burst=100, max_concurrency=8, base_delay=0.001,
+                    max_delay=0.01, failure_threshold=5, recovery_timeout=60)
+    settings.update(overrides)
+    return CallGovernor("test", **settings)
+
+
+def test_throttling_backs_off_without_opening_circuit():
+    governor = _governor()
+    attempts = {}
+    lock = threading.Lock()
+
+    def call_once_throttled(i):
+        with lock:
+            attempts[i] = attempts.get(i, 0) + 1
+            if attempts[i] == 1:
+                raise _HTTPError(429)
+        return i
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda i=i: results.append(governor.call(call_once_throttled, i)))
+        for i in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = governor.stats()
+    assert sorted(results) == list(range(6))
+    assert stats["state"] == "closed"
+    assert stats["throttled"] == 6
+    assert stats["failures"] == 0
+    assert stats["concurrency_limit"] < 8
+
+
+def test_server_errors_open_circuit():
+    governor = _governor(failure_threshold=2, max_retries=5)
+
+    def always_fails():
+        raise _HTTPError(503)
+
+    with pytest.raises(_HTTPError):
+        governor.call(always_fails)
+    assert governor.stats()["state"] == "open"
+    with pytest.raises(CircuitOpenError):
+        governor.call(lambda: "ok")
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_POST(self):
+        type(self).requests += 1
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}).encode()
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def throttling_api(monkeypatch):
+    """
+    Local OpenAI-compatible endpoint that answers every request with 429
+    """
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "test")
+    _ThrottlingHandler.requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    for module in (qa_processor, faq_extractor):
+        real_init = module.init_chat_model
+        monkeypatch.setattr(
+            module, "init_chat_model",
+            lambda *args, _real_init=real_init, **kwargs: _real_init(*args, **{**kwargs, "base_url": base_url})
+        )
+    yield _ThrottlingHandler
+    server.shutdown()
+    server.server_close()
+
+
+def test_model_429_reaches_governor_without_sdk_retries(throttling_api):
+    processor = qa_processor.QAProcessor()
+    processor.governor = _governor(max_retries=1)
+
+    with pytest.raises(Exception) as raised:
+        processor._invoke([("human", "你好")])
+
+    stats = processor.governor.stats()
+    assert raised.value.status_code == 429
+    # One HTTP request per governed attempt: the SDK does not retry on its own
+    assert throttling_api.requests == 2
+    assert stats["throttled"] == 2
+    assert stats["concurrency_limit"] < 8
+    assert stats["state"] == "closed"
+
+
+def test_extractor_stream_429_reaches_governor(throttling_api):
+    extractor = faq_extractor.FAQExtractor()
+    extractor.governor = _governor(max_retries=1)
+
+    assert list(extractor._extract_faqs_from_window("本产品支持两种安装方式。")) == []
+    assert throttling_api.requests == 2
+    assert extractor.governor.stats()["throttled"] == 2
@@ -0,0 +1,83 @@
+import pytest
+from src.database.conversation_store import ConversationStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "history" / "chat.db")
+
+
+def _fill(store, conversation_id, count):
+    return [
+        store.append_message(conversation_id, "user" if i % 2 == 0 else "assistant", f"消息{i}")
+        for i in range(count)
+    ]
+
+
+def test_append_and_recent_messages(db_path):
+    store = ConversationStore(db_path)
+    conversation_id = store.create_conversation()
+
+    appended = _fill(store, conversation_id, 5)
+
+    assert store.conversation_exists(conversation_id)
+    assert not store.conversation_exists("missing")
+    assert store.count_messages(conversation_id) == 5
+    assert appended[0] == {"id": appended[0]["id"], "role": "user", "content": "消息0"}
+    assert [m["content"] for m in store.recent_messages(conversation_id, 3)] == ["消息2", "消息3", "消息4"]
+
+
+def test_messages_before_pages_back_through_history(db_path):
+    store = ConversationStore(db_path)
+    conversation_id = store.create_conversation()
+    other_id = store.create_conversation()
+    _fill(store, conversation_id, 7)
+    _fill(store, other_id, 3)
+
+    page = store.recent_messages(conversation_id, 3)
+    pages = [page]
+    while page:
+        page = store.messages_before(conversation_id, page[0]["id"], 3)
+        if page:
+            pages.append(page)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    contents = [m["content"] for page in reversed(pages) for m in page]
+    assert contents == [f"消息{i}" for i in range(7)]
+
+
+def test_update_message(db_path):
+    store = ConversationStore(db_path)
+    conversation_id = store.create_conversation()
+    question, answer = _fill(store, conversation_id, 2)
+
+    store.update_message(answer["id"], "重新生成的答案")
+
+    assert [m["content"] for m in store.recent_messages(conversation_id, 10)] == ["消息0", "重新生成的答案"]
+
+
+def test_list_conversations_newest_first_with_counts(db_path):
+    store = ConversationStore(db_path)
+    first = store.create_conversation()
+    second = store.create_conversation()
+    third = store.create_conversation()
+    _fill(store, first, 4)
+    _fill(store, third, 1)
+
+    listed = store.list_conversations()
+
+    assert [(c["id"], c["message_count"]) for c in listed] == [(third, 1), (second, 0), (first, 4)]
+    assert [c["id"] for c in store.list_conversations(limit=1)] == [third]
+
+
+def test_history_persists_across_instances(db_path):
+    store = ConversationStore(db_path)
+    conversation_id = store.create_conversation()
+    _fill(store, conversation_id, 3)
+
+    reopened = ConversationStore(db_path)
+
+    assert reopened.conversation_exists(conversation_id)
+    assert reopened.count_messages(conversation_id) == 3
+    assert [m["content"] for m in reopened.recent_messages(conversation_id, 10)] == ["消息0", "消息1", "消息2"]
+    assert [c["id"] for c in reopened.list_conversations()] == [conversation_id]
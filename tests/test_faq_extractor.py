@@ -0,0 +1,214 @@
+import json
+import pytest
+from langchain_core.messages import AIMessageChunk
+from src.llm import faq_extractor as faq_extractor_module
+from src.llm.faq_extractor import FAQExtractor
+from src.utils.call_governor import CallGovernor
+
+
+class FakeStreamingModel:
+    """
+    Streams a compact-mode reply built by respond(window_text) in small chunks
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.windows = []
+        # Output tokens the fake provider reports in its final usage chunk
+        self.usage_output_tokens = None
+
+    def stream(self, messages, **kwargs):
+        window_text = messages[-1][1].rsplit("\n\n", 1)[-1]
+        self.windows.append(window_text)
+        reply = self.respond(window_text)
+        for i in range(0, len(reply), 7):
+            yield AIMessageChunk(content=reply[i:i + 7])
+        if self.usage_output_tokens is not None:
+            yield AIMessageChunk(content="", usage_metadata={
+                "input_tokens": 100, "output_tokens": self.usage_output_tokens, "total_tokens": 100 + self.usage_output_tokens,
+            })
+
+
+@pytest.fixture
+def make_extractor(monkeypatch):
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "test")
+    monkeypatch.setenv("FAQ_EXTRACTION_MODE", "compact")
+
+    def make(respond, **settings):
+        monkeypatch.setattr(faq_extractor_module, "init_chat_model", lambda *args, **kwargs: FakeStreamingModel(respond))
+        extractor = FAQExtractor()
+        extractor.governor = CallGovernor("test", rate_per_second=1000, burst=1000, max_concurrency=8)
+        for name, value in settings.items():
+            setattr(extractor, name, value)
+        return extractor
+    return make
+
+
+def compact_reply(*pairs):
+    return json.dumps({"f": [{"q": q, "a": a} for q, a in pairs]}, ensure_ascii=False)
+
+
+PROSE = "本产品支持两种安装方式，用户可以通过官方网站下载安装包，也可以使用命令行工具进行安装。"
+
+
+def test_seen_questions_are_not_yielded_again(make_extractor):
+    extractor = make_extractor(lambda window: compact_reply(("如何安装？", "下载安装包。"), ("如何卸载？", "运行卸载程序。")))
+
+    faqs = list(extractor.stream_faqs(PROSE * 3, seen_questions=["如何安装?"]))
+
+    assert [faq["问题"] for faq in faqs] == ["如何卸载？"]
+
+
+def test_cut_off_reply_counts_as_parse_failure(make_extractor):
+    reply = compact_reply(("如何安装？", "下载安装包。"), ("如何卸载？", "运行卸载程序。"))
+    extractor = make_extractor(lambda window: reply[:-12])
+
+    faqs = list(extractor.stream_faqs(PROSE * 3))
+    report = extractor.extraction_report()
+
+    assert [faq["问题"] for faq in faqs] == ["如何安装？"]
+    assert report["parse_errors"] == 1
+    assert report["parse_failure_rate"] == 0.5
+
+
+PAIRS = [("如何安装？", "下载安装包后双击运行。"), ("如何卸载？", "在控制面板中运行卸载程序。")]
+
+
+def test_verbose_mode_reports_no_savings(make_extractor, monkeypatch):
+    monkeypatch.setenv("FAQ_EXTRACTION_MODE", "verbose")
+    verbose_reply = json.dumps([{"问题": q, "答案": a} for q, a in PAIRS], ensure_ascii=False, indent=2)
+    extractor = make_extractor(lambda window: verbose_reply)
+
+    faqs = list(extractor.stream_faqs(PROSE * 3))
+    report = extractor.extraction_report()
+
+    assert extractor.extraction_mode == "verbose"
+    assert len(faqs) == 2
+    assert report["output_tokens"] > 0
+    assert abs(report["tokens_saved"]) <= 2
+
+
+def test_compact_savings_use_local_counts_not_provider_usage(make_extractor):
+    extractor = make_extractor(lambda window: compact_reply(*PAIRS))
+    extractor.llm.usage_output_tokens = 1000
+
+    list(extractor.stream_faqs(PROSE * 3))
+    report = extractor.extraction_report()
+
+    assert report["provider_output_tokens"] == 1000
+    assert report["output_tokens"] < report["verbose_tokens"]
+    assert report["tokens_saved"] == report["verbose_tokens"] - report["output_tokens"] > 0
+
+
+def _document(paragraphs=300, seed=7):
+    import random
+    rng = random.Random(seed)
+    clauses = ["本产品支持两种安装方式", "用户可以通过官方网站下载安装包", "也可以使用命令行工具进行安装",
+               "安装完成后请重启计算机", "如果遇到问题请联系技术支持", "配置文件位于用户目录下", "日志会自动轮转"]
+    return "\n".join(
+        "".join(rng.choice(clauses) + rng.choice("，。；") for _ in range(rng.randint(8, 20)))
+        for _ in range(paragraphs)
+    )
+
+
+def test_windows_cover_text_within_window_size(make_extractor):
+    extractor = make_extractor(lambda window: compact_reply())
+    text = _document()
+    windows = extractor._create_windows(text)
+
+    assert windows[0]["start"] == 0
+    assert windows[-1]["end"] == len(text)
+    for previous, window in zip(windows, windows[1:]):
+        # Each window starts inside the previous one: no text falls between windows
+        assert previous["start"] < window["start"] <= previous["end"] < window["end"]
+    for window in windows:
+        assert window["end"] - window["start"] <= extractor.window_size
+        assert window["text"] == text[window["start"]:window["end"]]
+
+
+def test_paragraph_edit_changes_only_nearby_windows(make_extractor):
+    extractor = make_extractor(lambda window: compact_reply())
+    text = _document()
+    paragraphs = text.split("\n")
+    paragraphs[len(paragraphs) // 2] = "这是修订后新增的一段说明文字，用于验证内容定义分块的稳定性。" * 3
+    edited = "\n".join(paragraphs)
+
+    before = {window["hash"] for window in extractor.plan_windows(text)}
+    after = extractor.plan_windows(edited)
+    changed = [window for window in after if window["hash"] not in before]
+
+    assert len(after) >= 10
+    assert 1 <= len(changed) <= 3
+    edit_start = edited.index("这是修订后")
+    for window in changed:
+        assert abs(window["start"] - edit_start) <= 2 * extractor.window_size
+
+
+KEEP_WINDOWS = {
+    "price_faq": "问：会员年费是多少？\n答：标准会员年费为198元，高级会员为398元，自2024年1月1日起执行。\n"
+                 "问：退款需要多久？\n答：一般在3至5个工作日内原路退回，最长不超过15天。\n",
+    "date_faq": "1. 公司成立于哪一年？公司成立于2003年5月，2010年12月在深圳证券交易所上市。\n"
+                "2. 2023年营收多少？2023年营业收入为12.5亿元，同比增长18.2%。\n",
+    "phone_faq": "问：客服电话是多少？\n答：400-123-4567，服务时间为每天9:00-21:00。\n"
+                 "问：门店几点营业？\n答：周一至周五10:00-22:00，周末9:30-22:30。\n",
+    "spec_prose": "本机额定电压为220V，额定频率50Hz，额定功率1500W。机身尺寸为300×200×100mm，净重2.5kg。"
+                  "工作温度范围为-10℃至40℃，相对湿度不超过85%。\n",
+    "spec_list": "电压：220V/50Hz\n功率：1500W\n尺寸：300×200×100mm\n重量：2.5kg\n容量：1.7L\n",
+    "english_faq": "Q: How long does shipping take?\nA: Orders ship within 2 business days and arrive in 3-5 days.\n",
+}
+
+SKIP_WINDOWS = {
+    "toc": "\n".join(f"第{i}章 产品概述........................{i * 7}\n{i}.1 安装说明......{i * 7 + 2}" for i in range(1, 30)),
+    "toc_without_leaders": "\n".join(f"{i}.{j} 安装与配置说明 {i * 10 + j}" for i in range(1, 8) for j in range(1, 5)),
+    "references": "\n".join(
+        f"[{i}] Zhang S, Li W. Deep learning for text classification. Journal of AI, 2019, 12(3): {i * 10}-{i * 10 + 9}."
+        for i in range(1, 40)
+    ),
+    "references_cn": "\n".join(
+        f"[{i}] 张三, 李四. 基于深度学习的文本分类方法研究[J]. 计算机学报, 2019, 42(3): {i * 10}-{i * 10 + 9}."
+        for i in range(1, 40)
+    ),
+    "references_apa": "\n".join(
+        f"Smith, J., & Lee, K. ({2000 + i}). Learning representations at scale. Proceedings of NeurIPS, {i}, "
+        f"{i * 10}–{i * 10 + 12}. https://doi.org/10.1000/{i}"
+        for i in range(1, 30)
+    ),
+    "numeric_table": "\n".join(f"{i}  {i * 3.14:.2f}  {i * 2}  {i * 100}  0.{i}5" for i in range(1, 80)),
+    "product_table": "\n".join(f"型号A{i:02d}  220V  {1000 + i * 50}W  {i * 0.5:.1f}kg  ¥{199 + i * 10}" for i in range(1, 60)),
+}
+
+RECOMMENDED_THRESHOLD = 0.3
+
+
+@pytest.mark.parametrize("name", sorted(KEEP_WINDOWS))
+def test_numeric_faq_and_spec_text_pass_the_prefilter(name):
+    assert faq_extractor_module._information_density(KEEP_WINDOWS[name]) >= RECOMMENDED_THRESHOLD + 0.1
+
+
+@pytest.mark.parametrize("name", sorted(SKIP_WINDOWS))
+def test_toc_references_and_tables_fail_the_prefilter(name):
+    assert faq_extractor_module._information_density(SKIP_WINDOWS[name]) < RECOMMENDED_THRESHOLD
+
+
+def test_prefilter_is_off_by_default(make_extractor):
+    extractor = make_extractor(lambda window: compact_reply(("目录里有什么？", "章节列表。")))
+    assert extractor.density_threshold == 0
+
+    assert len(list(extractor.stream_faqs(SKIP_WINDOWS["toc"]))) == 1
+    assert extractor.extraction_report()["skipped_windows"] == 0
+
+
+def test_prefilter_skips_low_density_windows_when_enabled(make_extractor):
+    extractor = make_extractor(
+        lambda window: compact_reply(("客服电话是多少？", "400-123-4567。")),
+        density_threshold=RECOMMENDED_THRESHOLD,
+    )
+    text = SKIP_WINDOWS["numeric_table"] + "\n" + KEEP_WINDOWS["phone_faq"] * 60
+
+    faqs = list(extractor.stream_faqs(text))
+    report = extractor.extraction_report()
+
+    assert len(faqs) == 1
+    assert report["skipped_windows"] >= 1
+    assert report["windows"] >= 1
+    assert all("400-123-4567" in window for window in extractor.llm.windows)
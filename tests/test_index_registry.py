@@ -0,0 +1,75 @@
+import time
+import pytest
+from src.database import index_registry
+from src.database.index_registry import IndexRegistry
+
+
+class _FakeVectorStore:
+    def __init__(self):
+        self.doc_counter = 0
+        self.read_only = False
+        self.dropped = False
+
+    def freeze(self):
+        self.read_only = True
+
+    def drop(self):
+        self.dropped = True
+
+
+@pytest.fixture(autouse=True)
+def fake_vector_store(monkeypatch):
+    monkeypatch.setattr(index_registry, "VectorStoreManager", _FakeVectorStore)
+
+
+def _fill(count):
+    def builder(vector_store):
+        vector_store.doc_counter = count
+    return builder
+
+
+def test_failed_build_is_not_cached():
+    registry = IndexRegistry(idle_ttl=60, max_vectors=1000)
+    built = []
+
+    def failing_builder(vector_store):
+        built.append(vector_store)
+        vector_store.doc_counter = 3
+        raise RuntimeError("provider down")
+
+    with pytest.raises(RuntimeError):
+        registry.acquire("doc", failing_builder)
+    assert built[0].dropped
+    assert registry.stats()["indexes"] == 0
+
+    lease = registry.acquire("doc", _fill(5))
+    assert lease.created
+    assert lease.vector_store.doc_counter == 5
+
+
+def test_same_document_is_shared():
+    registry = IndexRegistry(idle_ttl=60, max_vectors=1000)
+    first = registry.acquire("doc", _fill(5))
+    second = registry.acquire("doc", _fill(99))
+    assert not second.created
+    assert second.vector_store is first.vector_store
+    assert registry.stats()["referenced"] == 1
+
+
+def test_sweeper_evicts_idle_indexes_without_new_activity():
+    registry = IndexRegistry(idle_ttl=0.05, max_vectors=1000)
+    lease = registry.acquire("doc", _fill(5))
+    vector_store = lease.vector_store
+    lease.release()
+    assert registry.stats()["indexes"] == 1
+
+    registry.start_sweeper(0.01)
+    try:
+        deadline = time.monotonic() + 2
+        while registry.stats()["indexes"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        registry.stop_sweeper()
+
+    assert registry.stats()["indexes"] == 0
+    assert vector_store.dropped
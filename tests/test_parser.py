@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+from src.data import parser as parser_module
+from src.data.parser import DocumentParser, _clean_pages, _join_broken_lines, page_of
+
+
+def _manual_pages(count=6):
+    titles = ["概述", "安装", "配置", "使用", "维护", "故障", "附录", "索引"]
+    return [
+        f"某某产品用户手册  v2.0\n第{n}章 {titles[n - 1]}\n"
+        f"本章介绍产品的{titles[n - 1]}，请在操作前仔细阅读本章内容。\n"
+        f"第 {n} 页 共 {count} 页\n- {n} -"
+        for n in range(1, count + 1)
+    ]
+
+
+def test_repeated_headers_footers_and_page_numbers_are_removed():
+    pages, removed = _clean_pages(_manual_pages())
+
+    assert removed == 18
+    for n, page in enumerate(pages, start=1):
+        assert "用户手册" not in page
+        assert "页" not in page
+        assert f"- {n} -" not in page
+        assert page.startswith(f"第{n}章")
+
+
+def test_lines_on_few_pages_are_kept():
+    pages = _manual_pages(6)
+    pages[0] = "只在第一页出现的标题\n" + pages[0]
+    cleaned, _ = _clean_pages(pages)
+    assert cleaned[0].startswith("只在第一页出现的标题")
+
+
+def test_short_pages_keep_their_body_line():
+    pages = [f"Manual v1\nPage {n} body text that looks the same on every page.\n{n}" for n in range(1, 5)]
+    cleaned, removed = _clean_pages(pages)
+
+    assert removed == 8
+    assert cleaned == [f"Page {n} body text that looks the same on every page." for n in range(1, 5)]
+
+
+def test_too_few_pages_are_not_stripped():
+    pages = ["页眉\n正文一\n页脚", "页眉\n正文二\n页脚"]
+    assert _clean_pages(pages) == (["页眉\n正文一\n页脚", "页眉\n正文二\n页脚"], 0)
+
+
+def test_whitespace_is_normalized():
+    cleaned, _ = _clean_pages(["  多个　 空格\t\t在这里。  \n\n\n下一行"])
+    assert cleaned == ["多个 空格 在这里。\n下一行"]
+
+
+def test_hyphenated_latin_and_cjk_breaks_are_joined():
+    lines = [
+        "The device must be re-",
+        "started after each firmware update, and the",
+        "settings are kept.",
+        "本产品支持两种安装方式，用户可以通过官方",
+        "网站下载安装包。",
+    ]
+    assert _join_broken_lines(lines) == (
+        "The device must be restarted after each firmware update, and the settings are kept.\n"
+        "本产品支持两种安装方式，用户可以通过官方网站下载安装包。"
+    )
+
+
+def test_short_lines_and_sentence_ends_keep_their_breaks():
+    lines = [
+        "第4章 使用",
+        "本产品支持两种安装方式，用户可以通过官方网站下载。",
+        "安装完成后请重启计算机，以便所有配置生效。",
+        "1. 步骤",
+        "second step",
+    ]
+    assert _join_broken_lines(lines) == "\n".join(lines)
+
+
+def test_parse_pdf_reports_cleanup_and_keeps_page_starts(monkeypatch):
+    raw_pages = _manual_pages()
+    documents = [SimpleNamespace(page_content=page) for page in raw_pages]
+    monkeypatch.setattr(parser_module, "PyPDFLoader", lambda path: SimpleNamespace(load=lambda: documents))
+
+    parser = DocumentParser()
+    text = parser.parse_pdf("manual.pdf")
+
+    assert parser.cleanup_stats["removed_lines"] == 18
+    assert parser.cleanup_stats["removed_chars"] == sum(map(len, raw_pages)) - len(text) + len(raw_pages) - 1
+    for n in range(1, len(raw_pages) + 1):
+        assert page_of(parser.page_starts, text.index(f"第{n}章")) == n
@@ -0,0 +1,84 @@
+import pytest
+from langchain_core.messages import AIMessage
+from src.llm import prompts
+from src.llm.prompts import PromptCacheStats, pack_faqs
+
+
+@pytest.fixture(autouse=True)
+def char_tokens(monkeypatch):
+    # Two characters per token, matching the truncation fallback used without tiktoken
+    monkeypatch.setattr(prompts, "_encoding", None)
+    monkeypatch.setattr(prompts, "_encoding_loaded", True)
+    monkeypatch.setattr(prompts, "count_tokens", lambda text: max(1, len(text) // 2))
+
+
+def _faq(question, score, answer="答" * 20):
+    return {"question": question, "answer": answer, "relevance_score": score}
+
+
+def _cost(faq):
+    return prompts.count_tokens(f"Q: {faq['question']}\nA: {faq['answer']}") + 2
+
+
+def test_pack_faqs_orders_by_relevance():
+    faqs = [_faq("问题A", 0.2), _faq("问题B", 0.9), _faq("问题C", 0.5)]
+
+    context, packed = pack_faqs(faqs, token_budget=1000, max_answer_tokens=100)
+
+    assert [faq["question"] for faq in packed] == ["问题B", "问题C", "问题A"]
+    assert context.startswith("Q: 问题B\nA: ")
+    assert context.count("\n\n") == 2
+
+
+def test_pack_faqs_stops_at_token_budget():
+    faqs = [_faq("问题A", 0.9), _faq("问题B", 0.8), _faq("问题C", 0.7)]
+    budget = _cost(faqs[0]) + _cost(faqs[1]) + 1
+
+    context, packed = pack_faqs(faqs, token_budget=budget, max_answer_tokens=100)
+
+    assert [faq["question"] for faq in packed] == ["问题A", "问题B"]
+    assert "问题C" not in context
+
+
+def test_pack_faqs_truncates_long_answers():
+    context, packed = pack_faqs([_faq("问题A", 0.9, answer="长" * 100)], token_budget=1000, max_answer_tokens=5)
+
+    assert len(packed) == 1
+    assert context == "Q: 问题A\nA: " + "长" * 10 + "…"
+
+
+def test_pack_faqs_cuts_single_oversized_faq_to_budget():
+    faqs = [_faq("问题A", 0.9, answer="长" * 100), _faq("问题B", 0.1)]
+
+    context, packed = pack_faqs(faqs, token_budget=8, max_answer_tokens=100)
+
+    assert [faq["question"] for faq in packed] == ["问题A"]
+    assert context.startswith("Q: 问题A")
+    assert context.endswith("…")
+    assert len(context) == 8 * 2 + 1
+
+
+def test_pack_faqs_empty():
+    assert pack_faqs([], token_budget=100, max_answer_tokens=10) == ("", [])
+
+
+def test_cache_stats_read_cache_read_details():
+    stats = PromptCacheStats()
+    response = AIMessage(content="", usage_metadata={
+        "input_tokens": 100, "output_tokens": 5, "total_tokens": 105,
+        "input_token_details": {"cache_read": 64},
+    })
+
+    assert stats.record(response) == 64
+    assert stats.snapshot() == {"calls": 1, "prompt_tokens": 100, "cache_hit_tokens": 64, "cache_hit_rate": 0.64}
+
+
+def test_cache_stats_fall_back_to_deepseek_token_usage():
+    stats = PromptCacheStats()
+    response = AIMessage(content="", response_metadata={
+        "token_usage": {"prompt_tokens": 80, "prompt_cache_hit_tokens": 20},
+    })
+
+    assert stats.record(response) == 20
+    assert stats.record(AIMessage(content="")) == 0
+    assert stats.snapshot() == {"calls": 2, "prompt_tokens": 80, "cache_hit_tokens": 20, "cache_hit_rate": 0.25}
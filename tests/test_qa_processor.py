@@ -0,0 +1,179 @@
+import asyncio
+import threading
+from langchain_core.messages import AIMessage, AIMessageChunk
+from src.llm import prompts
+from src.llm.qa_processor import QAProcessor
+from src.utils.call_governor import CallGovernor
+
+
+class FakeChatModel:
+    """
+    Async chat model answering the pipeline's yes/no prompts from a few rules
+    """
+
+    def __init__(self, is_question=True, is_calculation=False, relevant=True, answer="根据参考信息，答案是42。"):
+        self.is_question = is_question
+        self.is_calculation = is_calculation
+        self.relevant = relevant
+        self.answer = answer
+        self.before_reply = None
+        self.calls = []
+
+    async def ainvoke(self, messages, **kwargs):
+        instruction = messages[-1][1]
+        self.calls.append(instruction)
+        if self.before_reply is not None:
+            await self.before_reply()
+        if instruction.startswith(prompts.QUESTION_DETECTION_INSTRUCTION):
+            return AIMessage(content="是" if self.is_question else "否")
+        if instruction.startswith(prompts.CALCULATION_DETECTION_INSTRUCTION):
+            return AIMessage(content="是" if self.is_calculation else "否")
+        if instruction.startswith(prompts.RELEVANCE_INSTRUCTION):
+            return AIMessage(content="是" if self.relevant else "否")
+        return AIMessage(content=self.answer)
+
+    def invoke(self, messages, **kwargs):
+        # The sync pipeline runs in a plain thread, so each call gets its own loop
+        return asyncio.run(self.ainvoke(messages, **kwargs))
+
+    async def astream(self, messages, **kwargs):
+        self.calls.append(messages[-1][1])
+        for i in range(0, len(self.answer), 4):
+            yield AIMessageChunk(content=self.answer[i:i + 4])
+
+
+class FakeKnowledgeBase:
+    def __init__(self, faqs=None, search=None):
+        self.faqs = faqs if faqs is not None else [
+            {"question": "答案是什么？", "answer": "42", "relevance_score": 0.9, "doc_id": "d1", "page": 1},
+        ]
+        self.search = search
+        self.revision = 0
+        self.doc_counter = len(self.faqs)
+        self.queries = []
+
+    def similarity_search(self, query, top_k=5, doc_ids=None):
+        self.queries.append((query, doc_ids))
+        if self.search is not None:
+            self.search()
+        return list(self.faqs)
+
+    def documents(self):
+        return {"d1": "manual.pdf"}
+
+
+def make_processor(llm=None, knowledge_base=None):
+    processor = QAProcessor(llm=llm or FakeChatModel())
+    # The process-wide DeepSeek governor is rate limited for the real API
+    processor.governor = CallGovernor("test", rate_per_second=1000, burst=1000, max_concurrency=64)
+    if knowledge_base is not None:
+        processor.set_vector_store(knowledge_base)
+    return processor
+
+
+def test_discarding_running_speculation_counts_as_wasted():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_search():
+        started.set()
+        release.wait(5)
+
+    llm = FakeChatModel(is_question=False)
+
+    async def wait_for_search():
+        await asyncio.to_thread(started.wait, 5)
+
+    llm.before_reply = wait_for_search
+    processor = make_processor(llm, FakeKnowledgeBase(search=slow_search))
+
+    try:
+        answer = asyncio.run(processor.aprocess_question("你好呀"))
+    finally:
+        release.set()
+
+    assert answer == "根据参考信息，答案是42。"
+    assert processor.speculation_stats == {"started": 1, "used": 0, "wasted": 1, "cancelled": 0}
+
+
+def test_discarding_running_speculation_counts_as_wasted_sync():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_search():
+        started.set()
+        release.wait(5)
+
+    llm = FakeChatModel(is_question=False)
+
+    async def wait_for_search():
+        await asyncio.to_thread(started.wait, 5)
+
+    llm.before_reply = wait_for_search
+    processor = make_processor(llm, FakeKnowledgeBase(search=slow_search))
+
+    try:
+        answer = processor.process_question("你好呀")
+    finally:
+        release.set()
+
+    assert answer == "根据参考信息，答案是42。"
+    assert processor.speculation_stats == {"started": 1, "used": 0, "wasted": 1, "cancelled": 0}
+
+
+def test_aprocess_question_answers_from_knowledge_base():
+    knowledge_base = FakeKnowledgeBase()
+    llm = FakeChatModel()
+    processor = make_processor(llm, knowledge_base)
+
+    answer = asyncio.run(processor.aprocess_question("答案是什么？", doc_ids=["d1"]))
+
+    assert answer == "根据参考信息，答案是42。"
+    assert knowledge_base.queries == [("答案是什么？", ["d1"])]
+    assert "Q: 答案是什么？\nA: 42" in llm.calls[-1]
+
+
+def test_aprocess_question_reuses_pipeline_state():
+    llm = FakeChatModel()
+    processor = make_processor(llm, FakeKnowledgeBase())
+
+    asyncio.run(processor.aprocess_question("答案是什么？"))
+    first_calls = len(llm.calls)
+    asyncio.run(processor.aprocess_question("答案是什么？"))
+
+    # Routing and relevance are cached: only the answer is generated again
+    assert len(llm.calls) == first_calls + 1
+
+
+def test_aprocess_question_routes():
+    chitchat = make_processor(FakeChatModel(is_question=False, answer="你好！"), FakeKnowledgeBase())
+    assert asyncio.run(chitchat.aprocess_question("你好")) == "你好！"
+
+    calculation = make_processor(FakeChatModel(is_calculation=True), FakeKnowledgeBase())
+    assert asyncio.run(calculation.aprocess_question("12*3等于多少？")) == "计算结果是：36"
+
+    irrelevant = make_processor(FakeChatModel(relevant=False), FakeKnowledgeBase())
+    assert asyncio.run(irrelevant.aprocess_question("天气如何？")) == "「未找到相关内容」"
+
+    no_store = make_processor(FakeChatModel())
+    assert asyncio.run(no_store.aprocess_question("答案是什么？")) == "知识库尚未准备好，请先上传文档。"
+
+
+def test_astream_answer_yields_deltas():
+    processor = make_processor(FakeChatModel(), FakeKnowledgeBase())
+
+    async def collect():
+        return [delta async for delta in processor.astream_answer("答案是什么？")]
+
+    deltas = asyncio.run(collect())
+    assert len(deltas) > 1
+    assert "".join(deltas) == "根据参考信息，答案是42。"
+
+
+def test_concurrent_questions_share_one_event_loop():
+    processor = make_processor(FakeChatModel(), FakeKnowledgeBase())
+
+    async def ask_all():
+        return await asyncio.gather(*(processor.aprocess_question(f"问题{i}？") for i in range(50)))
+
+    assert set(asyncio.run(ask_all())) == {"根据参考信息，答案是42。"}
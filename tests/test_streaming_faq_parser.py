@@ -0,0 +1,74 @@
+import pytest
+from src.llm.faq_extractor import StreamingFAQParser
+
+
+def feed_in_chunks(parser, text, size):
+    faqs = []
+    for i in range(0, len(text), size):
+        faqs.extend(parser.feed(text[i:i + size]))
+    return faqs
+
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_list_split_at_any_point(size):
+    text = '[{"问题": "问1?", "答案": "答1。"}, {"问题": "问2?", "答案": "答2。"}]'
+    parser = StreamingFAQParser()
+
+    assert feed_in_chunks(parser, text, size) == [
+        {"问题": "问1?", "答案": "答1。"},
+        {"问题": "问2?", "答案": "答2。"},
+    ]
+    assert parser.parsed_count == 2
+    assert parser.error_count == 0
+
+
+def test_prose_and_code_fence_around_json_are_ignored():
+    text = '好的，以下是提取结果 "注意":\n```json\n[{"问题": "问1?", "答案": "答1。"}]\n```\n希望有帮助 {x}'
+    assert StreamingFAQParser().feed(text) == [{"问题": "问1?", "答案": "答1。"}]
+
+
+def test_braces_brackets_and_escaped_quotes_inside_strings():
+    text = r'[{"问题": "如何写 {\"a\": [1]}?", "答案": "用 } 和 ] 结尾\\"}]'
+    assert StreamingFAQParser().feed(text) == [{"问题": '如何写 {"a": [1]}?', "答案": "用 } 和 ] 结尾\\"}]
+
+
+def test_truncated_tail_keeps_completed_objects():
+    parser = StreamingFAQParser()
+    faqs = parser.feed('[{"问题": "问1?", "答案": "答1。"}, {"问题": "问2?", "答')
+    parser.close()
+
+    assert faqs == [{"问题": "问1?", "答案": "答1。"}]
+    assert parser.parsed_count == 1
+    assert parser.error_count == 1
+
+
+def test_invalid_and_incomplete_objects_are_counted():
+    parser = StreamingFAQParser()
+    faqs = parser.feed('[{"问题": "问1?"}, {"问题": "", "答案": "答"}, {"问题": "问2?", "答案": "答2。",}, '
+                       '{"问题": "问3?", "答案": "答3。"}]')
+
+    assert faqs == [{"问题": "问3?", "答案": "答3。"}]
+    assert parser.error_count == 3
+
+
+def test_nested_objects_are_not_emitted_separately():
+    text = '[{"问题": "问1?", "答案": "答1。", "来源": {"页": 1}}]'
+    assert StreamingFAQParser().feed(text) == [{"问题": "问1?", "答案": "答1。"}]
+
+
+@pytest.mark.parametrize("size", [1, 5, 1000])
+def test_compact_wrapper_with_short_keys(size):
+    text = '{"f":[{"q":"问1?","a":"答1。"},{"q":"问2?","a":"答2。"}]}'
+    parser = StreamingFAQParser(question_key="q", answer_key="a")
+
+    assert feed_in_chunks(parser, text, size) == [
+        {"问题": "问1?", "答案": "答1。"},
+        {"问题": "问2?", "答案": "答2。"},
+    ]
+
+
+def test_close_without_open_object_is_not_a_failure():
+    parser = StreamingFAQParser()
+    parser.feed('[{"问题": "问1?", "答案": "答1。"}]')
+    parser.close()
+    assert parser.error_count == 0
@@ -0,0 +1,123 @@
+import math
+import pytest
+from langchain_core.embeddings import Embeddings
+from src.database import vector_store as vector_store_module
+from src.database.index_registry import IndexRegistry, SessionKnowledgeBase
+from src.database.vector_store import VectorStoreManager, _doc_filter
+
+
+class CharEmbeddings(Embeddings):
+    """
+    Unit-normalised bag-of-characters vectors: identical texts have distance 0
+    """
+
+    def __init__(self, size=64):
+        self.size = size
+        self.queries = []
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for char in text:
+            vector[ord(char) % self.size] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self._embed(text)
+
+
+@pytest.fixture(autouse=True)
+def fake_embeddings(monkeypatch):
+    monkeypatch.setattr(vector_store_module, "DashScopeEmbeddings", lambda **kwargs: CharEmbeddings())
+
+
+def _faqs(prefix, count=3, page=1):
+    return [{"问题": f"{prefix}问题{i}", "答案": f"{prefix}答案{i}", "page": page} for i in range(count)]
+
+
+def _store(*documents):
+    store = VectorStoreManager()
+    for doc_id, page in documents:
+        store.add_faqs(_faqs(doc_id, page=page), doc_id=doc_id)
+    return store
+
+
+def test_doc_filter_uses_equality_for_one_document_and_in_for_several():
+    assert _doc_filter(None) is None
+    assert _doc_filter([]) is None
+    assert _doc_filter(["a"]) == {"doc_id": "a"}
+    assert _doc_filter(["a", "b"]) == {"doc_id": {"$in": ["a", "b"]}}
+
+
+def test_search_by_vector_is_restricted_to_selected_documents():
+    store = _store(("a", 1), ("b", 1), ("c", 1))
+    embedding = store.embed_query("问题0")
+
+    assert {faq["doc_id"] for faq in store.similarity_search_by_vector(embedding, top_k=9, doc_ids=["b"])} == {"b"}
+    assert {faq["doc_id"] for faq in store.similarity_search_by_vector(embedding, top_k=9, doc_ids=["a", "c"])} == {"a", "c"}
+    assert {faq["doc_id"] for faq in store.similarity_search_by_vector(embedding, top_k=9)} == {"a", "b", "c"}
+
+
+def test_exact_question_is_most_relevant():
+    store = _store(("a", 1), ("b", 1))
+
+    results = store.similarity_search("b问题2", top_k=6)
+
+    assert results[0]["question"] == "b问题2"
+    assert results[0]["relevance_score"] == pytest.approx(1.0)
+    assert all(result["relevance_score"] <= results[0]["relevance_score"] for result in results)
+
+
+def test_page_metadata_round_trips(tmp_path):
+    store = _store(("a", 7), ("b", 12))
+    pages = {faq["doc_id"]: faq["page"] for faq in store.similarity_search("问题1", top_k=6)}
+    assert pages == {"a": 7, "b": 12}
+
+    path = str(tmp_path / "doc.tdqa")
+    store.export_snapshot(path)
+    restored = VectorStoreManager()
+    restored.import_snapshot(path)
+    assert {faq["doc_id"]: faq["page"] for faq in restored.similarity_search("问题1", top_k=6)} == {"a": 7, "b": 12}
+
+
+def test_delete_document_removes_only_that_document():
+    store = _store(("a", 1), ("b", 1))
+
+    assert store.delete_document("a") == 3
+    assert store.doc_counter == 3
+    assert store.delete_document("missing") == 0
+    assert {faq["doc_id"] for faq in store.similarity_search("问题0", top_k=6)} == {"b"}
+
+
+def test_read_only_store_rejects_writes():
+    store = _store(("a", 1))
+    store.freeze()
+
+    with pytest.raises(RuntimeError):
+        store.delete_document("a")
+    with pytest.raises(RuntimeError):
+        store.add_faqs(_faqs("b"), doc_id="b")
+    assert store.doc_counter == 3
+
+
+def test_session_knowledge_base_merges_documents_by_relevance():
+    registry = IndexRegistry(idle_ttl=60, max_vectors=1000)
+    knowledge_base = SessionKnowledgeBase()
+    for doc_id in ("a", "b"):
+        lease = registry.acquire(doc_id, lambda vector_store, doc_id=doc_id: vector_store.add_faqs(_faqs(doc_id), doc_id=doc_id))
+        knowledge_base.add_document(lease, f"{doc_id}.pdf")
+
+    results = knowledge_base.similarity_search("b问题1", top_k=4)
+    assert len(results) == 4
+    assert results[0]["question"] == "b问题1"
+    scores = [faq["relevance_score"] for faq in results]
+    assert scores == sorted(scores, reverse=True)
+    # The query is embedded once for all partitions
+    assert knowledge_base.get_vector_store("a").embeddings.queries == ["b问题1"]
+
+    assert {faq["doc_id"] for faq in knowledge_base.similarity_search("问题1", top_k=6, doc_ids=["a"])} == {"a"}
+    assert knowledge_base.similarity_search("问题1", doc_ids=["missing"]) == []
@@ -0,0 +1,90 @@
+import json
+import struct
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.database import vector_store as vector_store_module
+from src.database.vector_store import SNAPSHOT_MAGIC, SNAPSHOT_VERSION, SnapshotError, VectorStoreManager
+
+
+@pytest.fixture(autouse=True)
+def fake_embeddings(monkeypatch):
+    monkeypatch.setattr(vector_store_module, "DashScopeEmbeddings", lambda **kwargs: DeterministicFakeEmbedding(size=8))
+
+
+def _store_with_faqs():
+    store = VectorStoreManager()
+    store.add_faqs([{"问题": f"问题{i}", "答案": f"答案{i}", "window_hash": "w1"} for i in range(3)], doc_id="doc")
+    store.source_window_hashes = {"w1", "w2"}
+    return store
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "doc.tdqa")
+    _store_with_faqs().export_snapshot(path)
+
+    restored = VectorStoreManager()
+    restored.import_snapshot(path)
+    assert restored.doc_counter == 3
+    assert restored.source_window_hashes == {"w1", "w2"}
+    assert {faq["question"] for faq in restored.similarity_search("问题1", top_k=3)} == {"问题0", "问题1", "问题2"}
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: data[:len(SNAPSHOT_MAGIC) + 3],
+    lambda data: data[:-5],
+    lambda data: SNAPSHOT_MAGIC + struct.pack("<HI", SNAPSHOT_VERSION, 2) + b"{}",
+    lambda data: SNAPSHOT_MAGIC + struct.pack("<HI", SNAPSHOT_VERSION, 5) + b"{oops",
+    lambda data: b"NOTASNAP" + data[8:],
+])
+def test_corrupt_snapshot_raises_snapshot_error(tmp_path, corrupt):
+    path = tmp_path / "doc.tdqa"
+    _store_with_faqs().export_snapshot(str(path))
+    path.write_bytes(corrupt(path.read_bytes()))
+
+    with pytest.raises(SnapshotError):
+        VectorStoreManager().import_snapshot(str(path))
+
+
+def test_header_without_fields_raises_snapshot_error(tmp_path):
+    header = json.dumps({"version": SNAPSHOT_VERSION}).encode("utf-8")
+    path = tmp_path / "doc.tdqa"
+    path.write_bytes(SNAPSHOT_MAGIC + struct.pack("<HI", SNAPSHOT_VERSION, len(header)) + header)
+
+    with pytest.raises(SnapshotError):
+        VectorStoreManager().import_snapshot(str(path))
+
+
+def _rewrite_header(data, **changes):
+    offset = len(SNAPSHOT_MAGIC)
+    version, header_size = struct.unpack_from("<HI", data, offset)
+    offset += struct.calcsize("<HI")
+    header = json.loads(data[offset:offset + header_size].decode("utf-8"))
+    header.update(changes)
+    encoded = json.dumps(header).encode("utf-8")
+    return SNAPSHOT_MAGIC + struct.pack("<HI", version, len(encoded)) + encoded + data[offset + header_size:]
+
+
+@pytest.mark.parametrize("changes", [
+    {"count": "3"},
+    {"count": True},
+    {"dim": -8},
+    {"records_size": 1.5},
+    {"records_size": None},
+    {"checksum": 123},
+    {"embedding_model": ["text-embedding-v1"]},
+])
+def test_header_with_wrong_field_types_raises_snapshot_error(tmp_path, changes):
+    path = tmp_path / "doc.tdqa"
+    _store_with_faqs().export_snapshot(str(path))
+    path.write_bytes(_rewrite_header(path.read_bytes(), **changes))
+
+    with pytest.raises(SnapshotError):
+        VectorStoreManager().import_snapshot(str(path))
+
+
+def test_rewritten_header_with_valid_fields_still_imports(tmp_path):
+    path = tmp_path / "doc.tdqa"
+    _store_with_faqs().export_snapshot(str(path))
+    path.write_bytes(_rewrite_header(path.read_bytes()))
+
+    assert VectorStoreManager().import_snapshot(str(path))["count"] == 3